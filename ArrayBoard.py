@@ -1,5 +1,45 @@
 import copy
 
+from zobrist import zobrist_keys, SIDE_KEY
+
+class History():
+    """Immutable stack of move records.
+
+    push() returns a new stack on top of this one, so make/unmake is O(1) and board copies can share
+    their history instead of copying it."""
+    __slots__ = ('entry', 'parent', 'length')
+
+    def __init__(self, entry=None, parent=None):
+        self.entry = entry
+        self.parent = parent
+        self.length = parent.length + 1 if parent is not None else 0
+
+    @classmethod
+    def from_entries(cls, entries):
+        history = cls()
+        for entry in entries:
+            history = history.push(entry)
+        return history
+
+    def push(self, entry):
+        return History(entry, self)
+
+    def __reduce__(self):
+        # pickled as a flat list oldest first, the nested stack would need one level of recursion per move
+        return History.from_entries, (list(self),)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        entries = []
+        node = self
+        while node.parent is not None:
+            entries.append(node.entry)
+            node = node.parent
+        return reversed(entries)
+
+
 class Board():
     EMPTY = 0
     PLAYER1 = 1
@@ -18,6 +58,44 @@ class Board():
     ]
     STANDARD_BEGINNING_PLAYER = PLAYER1
 
+    # packed moves are ints: from square (y * size_x + x) in the low 8 bits, the index into MOVE_DIRECTIONS of the
+    # step to the target square in the next 3 bits and optionally the captured neighbours of the target square
+    # (one bit per MOVE_DIRECTIONS entry) above that, so boards with more than MAX_PACKED_SQUARES squares can't
+    # use packed moves
+    MOVE_DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, -1), (-1, 1), (1, 1)]
+    DIRECTION_SHIFT = 8
+    CAPTURE_SHIFT = 11
+    MOVE_MASK = (1 << CAPTURE_SHIFT) - 1
+    MAX_PACKED_SQUARES = 1 << DIRECTION_SHIFT
+
+    # every board keeps material (PLAYER1 pieces - PLAYER2 pieces) up to date in move/undo, with this set it is
+    # checked against a full count after each of them
+    debug_evaluation = False
+
+    @classmethod
+    def starting_array(cls, size_x=5, size_y=5):
+        """The standard opening for any board size, 5x5 gives STANDARD_BOARD.
+
+        Each corner gets a block of pieces, PLAYER1 top left and bottom right, leaving the middle rows and
+        columns empty."""
+        block_x = (size_x - 1) // 2
+        block_y = (size_y - 1) // 2
+
+        board = []
+        for y in range(size_y):
+            row = []
+            for x in range(size_x):
+                left, right = x < block_x, x >= size_x - block_x
+                top, bottom = y < block_y, y >= size_y - block_y
+                if (left and top) or (right and bottom):
+                    row.append(cls.PLAYER1)
+                elif (right and top) or (left and bottom):
+                    row.append(cls.PLAYER2)
+                else:
+                    row.append(cls.EMPTY)
+            board.append(row)
+        return board
+
     @classmethod
     def from_string(cls, board, current_player, allow_diagonals=False):
         result = []
@@ -38,6 +116,56 @@ class Board():
     def valid_position(self, x, y):
         return 0 <= x < self.size_x and 0 <= y < self.size_y
 
+    def pack_move(self, move, captures=0):
+        if self.size_x * self.size_y > Board.MAX_PACKED_SQUARES:
+            raise ValueError("packed moves support at most {} squares, got {}x{}".format(
+                Board.MAX_PACKED_SQUARES, self.size_x, self.size_y))
+        (from_x, from_y), (to_x, to_y) = move
+        direction = Board.MOVE_DIRECTIONS.index((to_x - from_x, to_y - from_y))
+        return (from_y * self.size_x + from_x) | (direction << Board.DIRECTION_SHIFT) | (captures << Board.CAPTURE_SHIFT)
+
+    def unpack_move(self, packed):
+        from_y, from_x = divmod(packed & (Board.MAX_PACKED_SQUARES - 1), self.size_x)
+        dx, dy = Board.MOVE_DIRECTIONS[(packed >> Board.DIRECTION_SHIFT) & 7]
+        return (from_x, from_y), (from_x + dx, from_y + dy)
+
+    @staticmethod
+    def packed_captures(packed):
+        return packed >> Board.CAPTURE_SHIFT
+
+    def _capture_bits(self, move):
+        # reference implementation, plays the move and checks which neighbours of the target changed owner
+        to_x, to_y = move[1]
+        neighbors = [(d, to_x + dx, to_y + dy) for d, (dx, dy) in enumerate(Board.MOVE_DIRECTIONS)
+                     if self.valid_position(to_x + dx, to_y + dy)]
+        before = [self.value(x, y) for _, x, y in neighbors]
+        self.apply(move)
+        captures = sum(1 << d for (d, x, y), value in zip(neighbors, before) if value and self.value(x, y) == -value)
+        self.undo()
+        return captures
+
+    def get_moves_packed(self, with_captures=False):
+        if with_captures:
+            return [self.pack_move(move, self._capture_bits(move)) for move in self.get_moves()]
+        return [self.pack_move(move) for move in self.get_moves()]
+
+    def _check_material(self):
+        expected = self.count_pieces(Board.PLAYER1) - self.count_pieces(Board.PLAYER2)
+        if self.material != expected:
+            raise AssertionError("material is {} but the board has {}".format(self.material, expected))
+
+    def get_captures_packed(self, with_captures=False):
+        """Packed moves that capture at least one piece."""
+        moves = [move for move in self.get_moves_packed(with_captures=True) if move >> Board.CAPTURE_SHIFT]
+        return moves if with_captures else [move & Board.MOVE_MASK for move in moves]
+
+    def move_packed(self, packed):
+        return self.move(self.unpack_move(packed))
+
+    def apply_packed(self, packed):
+        """Plays a packed move without validating it, only use for moves returned by get_moves_packed()."""
+        return self.apply(self.unpack_move(packed))
+
 
 class ArrayBoard(Board):
     def __init__(self, board, current_player, allow_diagonals=False):
@@ -48,16 +176,18 @@ class ArrayBoard(Board):
         else:
             self.other_player = ArrayBoard.PLAYER1
 
-        self.history = []
+        self.history = History()
         self.allow_diagonals = allow_diagonals
+        self.key = self._compute_key()
+        self.material = self.count_pieces(ArrayBoard.PLAYER1) - self.count_pieces(ArrayBoard.PLAYER2)
 
     @classmethod
     def from_array(cls, board, current_player, allow_diagonals=False):
         return cls(board, current_player, allow_diagonals=allow_diagonals)
 
     @classmethod
-    def standard_board(cls, allow_diagonals=False):
-        return cls(ArrayBoard.STANDARD_BOARD, ArrayBoard.STANDARD_BEGINNING_PLAYER, allow_diagonals=allow_diagonals)
+    def standard_board(cls, allow_diagonals=False, size_x=5, size_y=5):
+        return cls(ArrayBoard.starting_array(size_x, size_y), ArrayBoard.STANDARD_BEGINNING_PLAYER, allow_diagonals=allow_diagonals)
 
 
     @property
@@ -81,10 +211,13 @@ class ArrayBoard(Board):
             return self._get_normal_neighbors(x, y)
 
     def get_moves(self):
+        return self._get_moves_for(self.current_player)
+
+    def _get_moves_for(self, player):
         possible_moves = []
         for y, row in enumerate(self.board):
             for x, field in enumerate(row):
-                if not field == self.current_player:
+                if not field == player:
                     continue
                 possible_moves.extend([((x,y), n) for n in self._get_all_neighbors(x, y) if self.board[n[1]][n[0]] == ArrayBoard.EMPTY])
         return possible_moves
@@ -93,13 +226,9 @@ class ArrayBoard(Board):
         return self.board[y][x]
 
     def copy(self):
-        import copy
-        board_copy = ArrayBoard.standard_board()
-        board_copy.board = copy.deepcopy(self.board)
-        board_copy.current_player = self.current_player
-        board_copy.history = copy.deepcopy(self.history)
-        board_copy.allow_diagonals = self.allow_diagonals
-
+        board_copy = ArrayBoard.__new__(ArrayBoard)
+        board_copy.__dict__.update(self.__dict__)
+        board_copy.board = [row[:] for row in self.board]
         return board_copy
 
     def empty(self, x, y):
@@ -123,6 +252,16 @@ class ArrayBoard(Board):
         if not (from_x, from_y) in to_neighbors:
             return ArrayBoard.INVALID_MOVE
 
+        return self.apply(move)
+
+    def apply(self, move):
+        """Plays a move without validating it, only use for moves returned by get_moves()."""
+        (from_x, from_y), (to_x, to_y) = move
+
+        player1_keys, player2_keys = zobrist_keys(self.size_x * self.size_y)
+        keys = player1_keys if self.current_player == ArrayBoard.PLAYER1 else player2_keys
+        key = self.key ^ keys[from_y * self.size_x + from_x] ^ keys[to_y * self.size_x + to_x] ^ SIDE_KEY
+
         changes = []
         self.set_player_at(to_x, to_y, self.current_player)
         self.empty(from_x, from_y)
@@ -141,10 +280,18 @@ class ArrayBoard(Board):
                     self.set_player_at(diag_x, diag_y, self.current_player)
                     changes.append((diag_x, diag_y))
 
-        self.history.append((move, changes))
+        for x, y in changes:
+            key ^= player1_keys[y * self.size_x + x] ^ player2_keys[y * self.size_x + x]
+
+        self.history = self.history.push((move, changes, self.key, self.material))
+        self.key = key
+        # every captured piece changes sides
+        self.material += 2 * len(changes) * self.current_player
 
         self.switch_player()
 
+        if self.debug_evaluation:
+            self._check_material()
         return self
 
     def switch_player(self):
@@ -156,7 +303,8 @@ class ArrayBoard(Board):
             self.other_player = ArrayBoard.PLAYER2
 
     def undo(self):
-        ((to_x, to_y), (from_x, from_y)), changes = self.history.pop()
+        ((to_x, to_y), (from_x, from_y)), changes, self.key, self.material = self.history.entry
+        self.history = self.history.parent
 
         for x, y in changes:
             self.set_player_at(x, y, self.current_player)
@@ -165,28 +313,49 @@ class ArrayBoard(Board):
         self.set_player_at(to_x, to_y, self.current_player)
         self.empty(from_x, from_y)
 
+        if self.debug_evaluation:
+            self._check_material()
+
     def winner(self):
-        moves = self.get_moves()
-        if not moves:
-            return ArrayBoard.PLAYER1 if self.current_player == ArrayBoard.PLAYER2 else ArrayBoard.PLAYER2
+        other_player = ArrayBoard.PLAYER1 if self.current_player == ArrayBoard.PLAYER2 else ArrayBoard.PLAYER2
+        if not self.has_moves(self.current_player):
+            return other_player
 
-        self.switch_player()
-        moves = self.get_moves()
-        self.switch_player()
-        if not moves:
-            return ArrayBoard.PLAYER1 if not self.current_player == ArrayBoard.PLAYER2 else ArrayBoard.PLAYER2
+        if not self.has_moves(other_player):
+            return self.current_player
 
         return ArrayBoard.NO_WINNER
 
     def get_num_occupied_fields(self, player):
         return sum(1 for row in self.board for field in row if field == player)
 
+    def count_pieces(self, player):
+        return self.get_num_occupied_fields(player)
+
+    def count_moves(self, player):
+        return len(self._get_moves_for(player))
+
+    def has_moves(self, player):
+        return bool(self._get_moves_for(player))
+
     def hash(self):
-        return hash(str(self.board)+str(self.current_player))
+        return self.key
+
+    def _compute_key(self):
+        player1_keys, player2_keys = zobrist_keys(self.size_x * self.size_y)
+        key = SIDE_KEY if self.current_player == ArrayBoard.PLAYER2 else 0
+        for y, row in enumerate(self.board):
+            for x, field in enumerate(row):
+                if field == ArrayBoard.PLAYER1:
+                    key ^= player1_keys[y * self.size_x + x]
+                elif field == ArrayBoard.PLAYER2:
+                    key ^= player2_keys[y * self.size_x + x]
+        return key
 
     def rotate_left(self):
         new_board = self.copy()
         new_board.board = [list(x) for x in list(zip(*reversed(self.board)))]
+        new_board.key = new_board._compute_key()
         return new_board
 
 
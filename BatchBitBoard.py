@@ -0,0 +1,247 @@
+import numpy as np
+
+from ArrayBoard import Board
+from BitBoard import BitBoard, BitBoardGeometry
+
+ONE = np.uint64(1)
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(a):
+        return np.bitwise_count(a).astype(np.int64)
+else:
+    _BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+    def popcount(a):
+        a = np.ascontiguousarray(a, dtype=np.uint64)
+        return _BYTE_COUNTS[a.view(np.uint8)].reshape(a.shape + (8,)).sum(axis=-1)
+
+
+def lowest_bit_index(a):
+    """Bit index of the lowest set bit of every non zero entry."""
+    low = a & (~a + ONE)
+    return np.log2(low.astype(np.float64)).astype(np.int64)
+
+
+class BatchBitBoard():
+    """N BitBoard positions of the same shape stepped together with numpy.
+
+    player1/player2 are uint64 arrays using the BitBoard bit layout and current_player holds Board.PLAYER1 or
+    Board.PLAYER2 per position. Move generation and captures use the masks of the shared BitBoardGeometry, so the
+    rules are exactly those of BitBoard, except that positions carry no history and repetition draws are not
+    detected. Boards are limited to 64 squares."""
+
+    def __init__(self, player1, player2, current_player, size_x, size_y, allow_diagonals=False):
+        if size_x * size_y > 64:
+            raise ValueError("BatchBitBoard supports at most 64 squares, got {}x{}".format(size_x, size_y))
+
+        self.player1 = np.asarray(player1, dtype=np.uint64)
+        self.player2 = np.asarray(player2, dtype=np.uint64)
+        self.current_player = np.asarray(current_player, dtype=np.int8)
+
+        self.size_x = size_x
+        self.size_y = size_y
+        self.allow_diagonals = allow_diagonals
+        self.geometry = BitBoardGeometry.get(size_x, size_y, allow_diagonals)
+
+        g = self.geometry
+        self.full = np.uint64(g.full)
+        self.move_shifts = [(np.uint64(mask), shift) for mask, shift in g.move_shifts]
+        self.neighbors = np.array(g.neighbors, dtype=np.uint64)
+        self.diagonals = np.zeros((g.num_squares, 4), dtype=np.uint64)
+        self.pairs = np.zeros((g.num_squares, 4), dtype=np.uint64)
+        for idx, diagonal_pairs in enumerate(g.diagonal_pairs):
+            for k, (diagonal, pair) in enumerate(diagonal_pairs):
+                self.diagonals[idx, k] = diagonal
+                self.pairs[idx, k] = pair
+
+    @classmethod
+    def from_boards(cls, boards):
+        first = boards[0]
+        return cls([b.player1 for b in boards], [b.player2 for b in boards], [b.current_player for b in boards],
+                   first.size_x, first.size_y, first.allow_diagonals)
+
+    @classmethod
+    def standard_boards(cls, n, allow_diagonals=False, size_x=5, size_y=5):
+        return cls.from_boards([BitBoard.standard_board(allow_diagonals, size_x, size_y)] * n)
+
+    def __len__(self):
+        return len(self.player1)
+
+    def board(self, i):
+        return BitBoard(int(self.player1[i]), int(self.player2[i]), int(self.current_player[i]),
+                        self.size_x, self.size_y, self.allow_diagonals)
+
+    def copy(self):
+        batch = BatchBitBoard.__new__(BatchBitBoard)
+        batch.__dict__.update(self.__dict__)
+        batch.player1 = self.player1.copy()
+        batch.player2 = self.player2.copy()
+        batch.current_player = self.current_player.copy()
+        return batch
+
+    def _select(self, mask):
+        batch = BatchBitBoard.__new__(BatchBitBoard)
+        batch.__dict__.update(self.__dict__)
+        batch.player1 = self.player1[mask]
+        batch.player2 = self.player2[mask]
+        batch.current_player = self.current_player[mask]
+        return batch
+
+    def _players(self):
+        is_player1 = self.current_player == Board.PLAYER1
+        return (np.where(is_player1, self.player1, self.player2),
+                np.where(is_player1, self.player2, self.player1))
+
+    def _move_masks(self, player):
+        empty = self.full ^ (self.player1 | self.player2)
+        masks = []
+        for movable, shift in self.move_shifts:
+            if shift > 0:
+                masks.append(((player & movable) << np.uint64(shift)) & empty)
+            else:
+                masks.append(((player & movable) >> np.uint64(-shift)) & empty)
+        return masks
+
+    def move_masks(self):
+        """Target squares of the side to move per direction, in the order of BitBoard.DIRECTIONS."""
+        return self._move_masks(self._players()[0])
+
+    def count_moves(self):
+        return sum(popcount(m) for m in self.move_masks())
+
+    def has_moves(self):
+        result = np.zeros(len(self), dtype=bool)
+        for m in self.move_masks():
+            result |= m != 0
+        return result
+
+    def count_pieces(self, player):
+        return popcount(self.player1 if player == Board.PLAYER1 else self.player2)
+
+    def evaluate(self):
+        """Piece difference from the point of view of the side to move."""
+        player, other_player = self._players()
+        return popcount(player) - popcount(other_player)
+
+    def winner(self):
+        """Board.PLAYER1/PLAYER2 where a player cannot move, 0 otherwise (same order of checks as BitBoard.winner)."""
+        player1_moves = np.zeros(len(self), dtype=bool)
+        player2_moves = np.zeros(len(self), dtype=bool)
+        for m in self._move_masks(self.player1):
+            player1_moves |= m != 0
+        for m in self._move_masks(self.player2):
+            player2_moves |= m != 0
+
+        result = np.zeros(len(self), dtype=np.int8)
+        result[~player2_moves] = Board.PLAYER1
+        result[~player1_moves] = Board.PLAYER2
+        return result
+
+    def apply(self, from_idx, to_idx, active=None):
+        """Plays one move per position given as BitBoard bit indices, positions where active is False are kept."""
+        from_idx = np.clip(np.asarray(from_idx, dtype=np.int64), 0, self.geometry.num_squares - 1)
+        to_idx = np.clip(np.asarray(to_idx, dtype=np.int64), 0, self.geometry.num_squares - 1)
+        if active is None:
+            active = np.ones(len(self), dtype=bool)
+
+        player, other_player = self._players()
+
+        captured = self.neighbors[to_idx] & other_player
+        diagonal_captures = np.zeros(len(self), dtype=np.uint64)
+        for k in range(4):
+            pair = self.pairs[to_idx, k]
+            diagonal_captures |= np.where((captured & pair) == pair, self.diagonals[to_idx, k], 0) & other_player
+        captured |= diagonal_captures
+
+        moved = (ONE << from_idx.astype(np.uint64)) | (ONE << to_idx.astype(np.uint64))
+        player = np.where(active, player ^ moved ^ captured, player)
+        other_player = np.where(active, other_player ^ captured, other_player)
+
+        is_player1 = self.current_player == Board.PLAYER1
+        self.player1 = np.where(is_player1, player, other_player)
+        self.player2 = np.where(is_player1, other_player, player)
+        self.current_player = np.where(active, -self.current_player, self.current_player).astype(np.int8)
+        return self
+
+    def random_moves(self, rng=np.random):
+        """One uniformly chosen legal move per position as (from_idx, to_idx, has_move).
+
+        rng is a np.random.Generator, a RandomState or the np.random module."""
+        masks = self.move_masks()
+        counts = [popcount(m) for m in masks]
+        total = sum(counts)
+        has_move = total > 0
+        rank = np.floor(rng.random(len(self)) * total).astype(np.int64)
+
+        # find the direction the rank falls into, then drop that many low bits of its target mask
+        chosen = np.zeros(len(self), dtype=np.uint64)
+        offset = np.zeros(len(self), dtype=np.int64)
+        bit_rank = np.zeros(len(self), dtype=np.int64)
+        found = np.zeros(len(self), dtype=bool)
+        for m, c, (_, shift) in zip(masks, counts, self.move_shifts):
+            here = ~found & (rank < c)
+            chosen = np.where(here, m, chosen)
+            offset = np.where(here, shift, offset)
+            bit_rank = np.where(here, rank, bit_rank)
+            found |= here
+            rank = np.where(found, rank, rank - c)
+
+        for _ in range(int(bit_rank.max()) if len(self) else 0):
+            drop = bit_rank > 0
+            chosen = np.where(drop, chosen & (chosen - ONE), chosen)
+            bit_rank -= drop
+
+        to_idx = np.where(has_move, lowest_bit_index(np.where(has_move, chosen, ONE)), 0)
+        from_idx = to_idx - offset
+        return from_idx, to_idx, has_move
+
+    def playout(self, max_moves=200, rng=np.random):
+        """Plays uniformly random moves in every position until it is decided, returns the winners (0 if undecided)."""
+        batch = self.copy()
+        winners = batch.winner()
+        for _ in range(max_moves):
+            active = winners == 0
+            if not active.any():
+                break
+            from_idx, to_idx, _ = batch.random_moves(rng)
+            batch.apply(from_idx, to_idx, active)
+            winners = np.where(active, batch.winner(), winners)
+        return winners
+
+    def children(self):
+        """All positions reachable in one move as a new batch, plus the index of each child's parent."""
+        player1, player2, current_player, parents = [], [], [], []
+        indices = np.arange(len(self))
+        for m, (_, shift) in zip(self.move_masks(), self.move_shifts):
+            m = m.copy()
+            while True:
+                has_bit = m != 0
+                if not has_bit.any():
+                    break
+                parent = indices[has_bit]
+                to_idx = lowest_bit_index(m[has_bit])
+                m[has_bit] &= m[has_bit] - ONE
+
+                child = self._select(parent)
+                child.apply(to_idx - shift, to_idx)
+                player1.append(child.player1)
+                player2.append(child.player2)
+                current_player.append(child.current_player)
+                parents.append(parent)
+
+        if not parents:
+            return self._select(np.zeros(0, dtype=np.int64)), np.zeros(0, dtype=np.int64)
+
+        batch = BatchBitBoard.__new__(BatchBitBoard)
+        batch.__dict__.update(self.__dict__)
+        batch.player1 = np.concatenate(player1)
+        batch.player2 = np.concatenate(player2)
+        batch.current_player = np.concatenate(current_player)
+        return batch, np.concatenate(parents)
+
+    def perft(self, depth):
+        """Number of move sequences of length depth summed over the batch, games end when a player cannot move."""
+        batch = self
+        for _ in range(depth - 1):
+            batch, _ = batch.children()
+        return int(batch.count_moves().sum()) if depth else len(self)
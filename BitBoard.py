@@ -1,59 +1,276 @@
-from ArrayBoard import Board
+from ArrayBoard import Board, History
 from display import print_board
+from patterns import PatternWindows
+from zobrist import zobrist_keys, SIDE_KEY
 
-import random
-import copy
+try:
+    popcount = int.bit_count
+except AttributeError:
+    def popcount(b):
+        return bin(b).count('1')
+
+
+class BitBoardGeometry():
+    """Masks and lookup tables for one board shape.
+
+    Built once per (size_x, size_y, allow_diagonals) by get() and shared by every board of that shape, boards must
+    never modify it. Squares are indexed by bit position, (0, 0) is the most significant bit."""
+    _cache = {}
+
+    @classmethod
+    def get(cls, size_x, size_y, allow_diagonals=False):
+        shape = (size_x, size_y, allow_diagonals)
+        geometry = cls._cache.get(shape)
+        if geometry is None:
+            geometry = cls._cache[shape] = cls(size_x, size_y, allow_diagonals)
+        return geometry
+
+    def __reduce__(self):
+        # pickled boards (e.g. sent to worker processes) share the cached geometry on the other side
+        return BitBoardGeometry.get, (self.size_x, self.size_y, self.allow_diagonals)
+
+    def __getattr__(self, name):
+        # the tables for packed moves are only built once they are used, on boards too large for packed moves the
+        # tuple moves still work
+        if name not in ('packed_table', 'square_bits'):
+            raise AttributeError(name)
+        if self.num_squares > Board.MAX_PACKED_SQUARES:
+            raise ValueError("packed moves support at most {} squares, got {}x{}".format(
+                Board.MAX_PACKED_SQUARES, self.size_x, self.size_y))
+
+        # packed moves for every (direction, target square), BitBoard.DIRECTIONS are the negated
+        # Board.MOVE_DIRECTIONS so both use the same direction index
+        self.packed_table = [[((y + dy) * self.size_x + x + dx) | (direction << Board.DIRECTION_SHIFT)
+                              for (x, y) in self.positions]
+                             for direction, (dx, dy) in enumerate(BitBoard.DIRECTIONS)]
+        # bit index of a row-major square
+        self.square_bits = [self.num_squares - square - 1 for square in range(self.num_squares)]
+        return getattr(self, name)
+
+    def __init__(self, size_x, size_y, allow_diagonals=False):
+        self.size_x = size_x
+        self.size_y = size_y
+        self.allow_diagonals = allow_diagonals
+        self.num_squares = size_x * size_y
+
+        row = (1 << size_x) - 1
+        self.full = (1 << self.num_squares) - 1
+        self.right_border = sum(1 << (y * size_x) for y in range(size_y))
+        self.left_border = self.right_border << (size_x - 1)
+        self.top_border = row << (size_x * (size_y - 1))
+        self.bottom_border = row
+
+        self.top_right = self.right_border | self.top_border
+        self.top_left = self.left_border | self.top_border
+        self.bottom_right = self.right_border | self.bottom_border
+        self.bottom_left = self.left_border | self.bottom_border
+
+        # pieces that can move in each direction, in the order of BitBoard.DIRECTIONS
+        self.not_left = self.full ^ self.left_border
+        self.not_right = self.full ^ self.right_border
+        self.not_top = self.full ^ self.top_border
+        self.not_bottom = self.full ^ self.bottom_border
+        self.not_top_left = self.full ^ self.top_left
+        self.not_top_right = self.full ^ self.top_right
+        self.not_bottom_left = self.full ^ self.bottom_left
+        self.not_bottom_right = self.full ^ self.bottom_right
+
+        # (pieces able to move, left shift) per direction, a negative shift is a right shift
+        self.move_shifts = [
+            (self.not_left, 1), (self.not_right, -1), (self.not_top, size_x), (self.not_bottom, -size_x),
+        ]
+        if allow_diagonals:
+            self.move_shifts.extend([
+                (self.not_top_left, size_x + 1), (self.not_top_right, size_x - 1),
+                (self.not_bottom_left, -(size_x - 1)), (self.not_bottom_right, -(size_x + 1)),
+            ])
+
+        self.pos_index = pos_index = {}
+        self.positions = [None] * self.num_squares
+        for y in range(size_y):
+            for x in range(size_x):
+                idx = self.num_squares - (y * size_x + x) - 1
+                self.pos_index[(x, y)] = idx
+                self.positions[idx] = (x, y)
+
+        # zobrist keys per bit position, capturing a square swaps its owner so flip_keys has both xor-ed in
+        player1_keys, player2_keys = zobrist_keys(self.num_squares)
+        self.player1_keys = player1_keys[::-1]
+        self.player2_keys = player2_keys[::-1]
+        self.flip_keys = [k1 ^ k2 for k1, k2 in zip(self.player1_keys, self.player2_keys)]
+
+        # move tuples for every (direction, target square) so move generation never allocates them
+        self.move_table = [[((x + dx, y + dy), (x, y)) for (x, y) in self.positions] for dx, dy in BitBoard.DIRECTIONS]
+
+        # change of bit index per step in each Board.MOVE_DIRECTIONS
+        self.bit_deltas = [-(dy * size_x + dx) for dx, dy in Board.MOVE_DIRECTIONS]
+        # (bit, direction) of every neighbour, used to turn a capture mask into packed capture bits
+        self.neighbor_directions = [
+            [(1 << pos_index[(x + dx, y + dy)], d) for d, (dx, dy) in enumerate(Board.MOVE_DIRECTIONS)
+             if (x + dx, y + dy) in self.pos_index]
+            for (x, y) in self.positions]
+
+        # orthogonal neighbours of the target square get captured directly,
+        # a diagonal square is captured when both squares of its pair were captured
+        self.neighbors = [0] * self.num_squares
+        self.diagonal_pairs = [()] * self.num_squares
+        for (x, y), idx in self.pos_index.items():
+            neighbors = 0
+            for n in [(x+1, y), (x-1, y), (x, y+1), (x, y-1)]:
+                if n in self.pos_index:
+                    neighbors |= 1 << self.pos_index[n]
+            self.neighbors[idx] = neighbors
+
+            pairs = []
+            for dx, dy in [(1, 1), (1, -1), (-1, 1), (-1, -1)]:
+                if (x+dx, y+dy) in self.pos_index:
+                    pair = (1 << self.pos_index[(x+dx, y)]) | (1 << self.pos_index[(x, y+dy)])
+                    pairs.append((1 << self.pos_index[(x+dx, y+dy)], pair))
+            self.diagonal_pairs[idx] = tuple(pairs)
+
+        self._symmetry_tables = None
+
+    def symmetries(self):
+        """Transforms (see BitBoard.SYMMETRIES) that map this board shape onto itself."""
+        if self.size_x == self.size_y:
+            return list(range(8))
+        return [BitBoard.IDENTITY, BitBoard.ROTATE_180, BitBoard.FLIP_X, BitBoard.FLIP_Y]
+
+    def symmetry_tables(self):
+        """Per symmetry: the square mapping and lookup tables working on 8 bit chunks of a bitboard.
+
+        Returns a list of (square_map, mask_tables, player1_key_tables, player2_key_tables), mask_tables[c][byte]
+        is the transformed mask of chunk c and the key tables give the zobrist key of the transformed pieces.
+        Built on first use only."""
+        if self._symmetry_tables is not None:
+            return self._symmetry_tables
+
+        max_x, max_y = self.size_x - 1, self.size_y - 1
+        transforms = [
+            lambda x, y: (x, y),
+            lambda x, y: (max_y - y, x),
+            lambda x, y: (max_x - x, max_y - y),
+            lambda x, y: (y, max_x - x),
+            lambda x, y: (max_x - x, y),
+            lambda x, y: (x, max_y - y),
+            lambda x, y: (y, x),
+            lambda x, y: (max_y - y, max_x - x),
+        ]
+
+        tables = [None] * len(transforms)
+        for symmetry in self.symmetries():
+            square_map = [self.pos_index[transforms[symmetry](x, y)] for (x, y) in self.positions]
+            mask_tables, player1_key_tables, player2_key_tables = [], [], []
+            for chunk in range(0, self.num_squares, 8):
+                masks, player1_keys, player2_keys = [0] * 256, [0] * 256, [0] * 256
+                for byte in range(1, 256):
+                    low = byte & -byte
+                    idx = chunk + low.bit_length() - 1
+                    rest = byte ^ low
+                    if idx < self.num_squares:
+                        target = square_map[idx]
+                        masks[byte] = masks[rest] | (1 << target)
+                        player1_keys[byte] = player1_keys[rest] ^ self.player1_keys[target]
+                        player2_keys[byte] = player2_keys[rest] ^ self.player2_keys[target]
+                    else:
+                        masks[byte], player1_keys[byte], player2_keys[byte] = masks[rest], player1_keys[rest], player2_keys[rest]
+                mask_tables.append(masks)
+                player1_key_tables.append(player1_keys)
+                player2_key_tables.append(player2_keys)
+            tables[symmetry] = (square_map, mask_tables, player1_key_tables, player2_key_tables)
+
+        self._symmetry_tables = tables
+        return tables
 
 
 class BitBoard(Board):
+    # offset from the target square back to the moving piece for every move direction,
+    # in the order used by get_move_masks()
+    DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+
+    # the 8 symmetries of a square board, rectangular boards only have identity, 180 degrees and the two flips
+    IDENTITY, ROTATE_LEFT, ROTATE_180, ROTATE_RIGHT, FLIP_X, FLIP_Y, TRANSPOSE, ANTI_TRANSPOSE = range(8)
+    SYMMETRIES = list(range(8))
+    INVERSE_SYMMETRY = [IDENTITY, ROTATE_RIGHT, ROTATE_180, ROTATE_LEFT, FLIP_X, FLIP_Y, TRANSPOSE, ANTI_TRANSPOSE]
+
+    # repetition counts changed since the shared base that copy() still copies instead of merging into a new base
+    MAX_REPETITION_OVERLAY = 32
 
     @classmethod
     def from_array(cls, board, current_player, allow_diagonals=False):
-        player1 = 0b0000000000000000000000000
-        player2 = 0b0000000000000000000000000
+        size_x = len(board[0])
+        size_y = len(board)
+
+        player1 = 0
+        player2 = 0
         for y, row in enumerate(board):
             for x, field in enumerate(row):
                 if field == Board.PLAYER1:
-                    player1 |= 1 << BitBoard.pos_to_int(x, y, len(board))
+                    player1 |= 1 << BitBoard.pos_to_int(x, y, size_x, size_y)
                 elif field == Board.PLAYER2:
-                    player2 |= 1 << BitBoard.pos_to_int(x, y, len(board))
-
-        size_x = len(board[0])
-        size_y = len(board)
+                    player2 |= 1 << BitBoard.pos_to_int(x, y, size_x, size_y)
 
         return BitBoard(player1=player1, player2=player2, current_player=current_player, size_x=size_x, size_y=size_y,
                         allow_diagonals=allow_diagonals)
 
     @classmethod
-    def standard_board(cls, allow_diagonals=False):
-        return cls.from_array(Board.STANDARD_BOARD, Board.STANDARD_BEGINNING_PLAYER, allow_diagonals)
+    def standard_board(cls, allow_diagonals=False, size_x=5, size_y=5):
+        return cls.from_array(Board.starting_array(size_x, size_y), Board.STANDARD_BEGINNING_PLAYER, allow_diagonals)
 
     def __init__(self, player1, player2, current_player, size_x, size_y, allow_diagonals=False):
         self.player1 = player1
         self.player2 = player2
         self.current_player = current_player
 
-        self.right_border = int('1'.zfill(size_x) * size_y, 2)
-        self.left_border = int(bin(1 << size_x - 1)[2:] * size_y, 2)
-        self.top_border = int('1' * size_x, 2) << (size_x * (size_y - 1))
-        self.bottom_border = int(('1' * size_x), 2)
-
-        self.top_right = self.right_border | self.top_border
-        self.top_left = self.left_border | self.top_border
-        self.bottom_right = self.right_border | self.bottom_border
-        self.bottom_left = self.left_border | self.bottom_border
-
         self.size_x = size_x
         self.size_y = size_y
 
         self.allow_diagonals = allow_diagonals
-        self.history = []
+        self.geometry = BitBoardGeometry.get(size_x, size_y, allow_diagonals)
+        self.history = History()
+
+        self.key = self._compute_key()
+        self.material = popcount(player1) - popcount(player2)
+
+        # (player1 masks, player2 masks) kept up to date by move/undo once enable_incremental_moves() was called
+        self.incremental_moves = False
+        self.move_masks = None
+
+        # pattern evaluation kept up to date by move/undo once enable_patterns() was called
+        self.pattern_weights = None
+        self.pattern_windows = None
+        self.pattern_score = None
+        self.pattern_indices = None
+
+        # how often each position key occurs in history: a base count that is never modified and shared by copies,
+        # plus this board's own changes to it since
+        self._repetition_base = {}
+        self._repetitions = {}
 
     def copy(self):
-        board = BitBoard(self.player1, self.player2, self.current_player, self.size_x, self.size_y, self.allow_diagonals)
-        board.history = copy.deepcopy(self.history)
+        if len(self._repetitions) > BitBoard.MAX_REPETITION_OVERLAY:
+            base = dict(self._repetition_base)
+            for key, change in self._repetitions.items():
+                count = base.get(key, 0) + change
+                if count:
+                    base[key] = count
+                else:
+                    del base[key]
+            self._repetition_base = base
+            self._repetitions = {}
+
+        board = BitBoard.__new__(BitBoard)
+        board.__dict__.update(self.__dict__)
+        board._repetitions = dict(self._repetitions)
         return board
 
+    def _count_repetition(self, key, change):
+        count = self._repetitions.get(key, 0) + change
+        if count:
+            self._repetitions[key] = count
+        else:
+            del self._repetitions[key]
+
     @property
     def other_player(self):
         if self.current_player == Board.PLAYER1:
@@ -66,22 +283,76 @@ class BitBoard(Board):
         return bin(self.player1).split('b')[1].zfill(self.size_x * self.size_y) + bin(self.player2).split('b')[1].zfill(self.size_x * self.size_y)
 
     def hash(self):
-        return hash(self.board + str(self.current_player))
+        return self.key
+
+    def _compute_key(self):
+        key = SIDE_KEY if self.current_player == Board.PLAYER2 else 0
+        for bits, keys in [(self.player1, self.geometry.player1_keys), (self.player2, self.geometry.player2_keys)]:
+            while bits:
+                low = bits & -bits
+                key ^= keys[low.bit_length() - 1]
+                bits ^= low
+        return key
+
+    def transform_bits(self, b, symmetry):
+        result = 0
+        for masks in self.geometry.symmetry_tables()[symmetry][1]:
+            result |= masks[b & 255]
+            b >>= 8
+        return result
+
+    def transform(self, symmetry):
+        """New board with the position mapped by one of SYMMETRIES, the history is not carried over."""
+        return BitBoard(self.transform_bits(self.player1, symmetry), self.transform_bits(self.player2, symmetry),
+                        self.current_player, self.size_x, self.size_y, self.allow_diagonals)
+
+    def rotate_left(self):
+        return self.transform(BitBoard.ROTATE_LEFT)
+
+    def transform_move(self, move, symmetry):
+        square_map = self.geometry.symmetry_tables()[symmetry][0]
+        pos_index, positions = self.geometry.pos_index, self.geometry.positions
+        return positions[square_map[pos_index[move[0]]]], positions[square_map[pos_index[move[1]]]]
+
+    def canonical_key(self):
+        """Smallest zobrist key over all symmetric variants of the position and the symmetry producing it.
+
+        Moves of this board map into the canonical position with transform_move(move, symmetry) and back with
+        INVERSE_SYMMETRY[symmetry]."""
+        side = SIDE_KEY if self.current_player == Board.PLAYER2 else 0
+        tables = self.geometry.symmetry_tables()
+        best_key, best_symmetry = None, None
+        for symmetry in self.geometry.symmetries():
+            _, _, player1_key_tables, player2_key_tables = tables[symmetry]
+            key = side
+            player1, player2 = self.player1, self.player2
+            for player1_keys, player2_keys in zip(player1_key_tables, player2_key_tables):
+                key ^= player1_keys[player1 & 255] ^ player2_keys[player2 & 255]
+                player1 >>= 8
+                player2 >>= 8
+            if best_key is None or key < best_key:
+                best_key, best_symmetry = key, symmetry
+        return best_key, best_symmetry
 
     def invert(self, b):
-        return int('1' * self.size_x * self.size_y, 2) - b
+        return self.geometry.full ^ b
 
     def _is_draw(self):
-        repeat = 0
-        for p1, p2, curp in self.history:
-            if p1 == self.player1 and p2 == self.player2 and curp == self.current_player:
-                repeat += 1
-        return repeat >= 3
+        key = self.key
+        return self._repetition_base.get(key, 0) + self._repetitions.get(key, 0) >= 3
+
+    def repetition_count(self):
+        """How often the current position already occurred earlier in the game."""
+        key = self.key
+        return self._repetition_base.get(key, 0) + self._repetitions.get(key, 0)
+
+    def is_repetition(self):
+        return self.repetition_count() > 0
 
     def winner(self):
-        if not self._get_moves_for(self.player1):
+        if not self.has_moves(Board.PLAYER1):
             return Board.PLAYER2
-        elif not self._get_moves_for(self.player2):
+        elif not self.has_moves(Board.PLAYER2):
             return Board.PLAYER1
 
         if self._is_draw():
@@ -90,12 +361,11 @@ class BitBoard(Board):
         return Board.NO_WINNER
 
     def _bit_scan(self, b):
-        if b == 0:
-            return []
         positions = []
-        for idx, bit in enumerate(bin(b)[2:].zfill(25)):
-            if bit == '1':
-                positions.append(self.int_to_pos(idx, self.size_x))
+        while b:
+            idx = b.bit_length() - 1
+            positions.append(self.geometry.positions[idx])
+            b ^= 1 << idx
         return positions
 
     @staticmethod
@@ -103,11 +373,11 @@ class BitBoard(Board):
         return (depth % row_size, depth // row_size)
 
     @staticmethod
-    def pos_to_int(x, y, row_size):
-        return row_size ** 2 - (y * row_size + x) - 1
+    def pos_to_int(x, y, size_x, size_y):
+        return size_x * size_y - (y * size_x + x) - 1
 
     def _pos_to_int(self, x, y):
-        return BitBoard.pos_to_int(x, y, self.size_x)
+        return BitBoard.pos_to_int(x, y, self.size_x, self.size_y)
 
     def _pretty_print(self, b):
         str_rep = bin(b).split('b')[1].zfill(self.size_x * self.size_y)
@@ -118,9 +388,9 @@ class BitBoard(Board):
         print("****")
 
     def value(self, x, y):
-        depth = self._pos_to_int(x, y)
+        depth = self.geometry.pos_index.get((x, y))
 
-        if depth < 0:
+        if depth is None:
             return Board.EMPTY
 
         is_current_player = (1 << depth) & self.player1
@@ -134,51 +404,78 @@ class BitBoard(Board):
         return Board.EMPTY
 
     def move(self, move):
-        ((from_x, from_y), (to_x, to_y)) = move
+        from_pos, to_pos = move
+        from_idx = self.geometry.pos_index.get(from_pos)
+        to_idx = self.geometry.pos_index.get(to_pos)
 
-        if not self.valid_position(from_x, from_y) or not self.valid_position(to_x, to_y):
-            print('INVALID POS', self.valid_position(from_x, from_y), self.valid_position(to_x, to_y))
+        if from_idx is None or to_idx is None:
             return Board.INVALID_MOVE
 
-        if not self.value(from_x, from_y) == self.current_player:
-            print('INVALID MOVE, from not player', self.value(from_x, from_y), self.current_player)
+        player = self.player1 if self.current_player == Board.PLAYER1 else self.player2
+        if not (player >> from_idx) & 1:
             return Board.INVALID_MOVE
 
-        if not self.value(to_x, to_y) == Board.EMPTY:
-            print('INVALID MOVE to not empty', self.value(to_x, to_y) == Board.EMPTY)
+        if ((self.player1 | self.player2) >> to_idx) & 1:
             return Board.INVALID_MOVE
 
+        return self._apply(from_idx, to_idx)
+
+    def apply(self, move):
+        """Plays a move without validating it, only use for moves returned by get_moves()."""
+        pos_index = self.geometry.pos_index
+        return self._apply(pos_index[move[0]], pos_index[move[1]])
+
+    def apply_packed(self, packed):
+        """Plays a packed move without validating it, only use for moves returned by get_moves_packed()."""
+        from_idx = self.geometry.square_bits[packed & (Board.MAX_PACKED_SQUARES - 1)]
+        return self._apply(from_idx, from_idx + self.geometry.bit_deltas[(packed >> Board.DIRECTION_SHIFT) & 7])
+
+    def _captured(self, to_idx, other_player):
+        captured = self.geometry.neighbors[to_idx] & other_player
+        if captured:
+            for diagonal, pair in self.geometry.diagonal_pairs[to_idx]:
+                if captured & pair == pair:
+                    captured |= diagonal & other_player
+        return captured
+
+    def _apply(self, from_idx, to_idx):
+        geometry = self.geometry
         if self.current_player == Board.PLAYER1:
             player = self.player1
             other_player = self.player2
+            keys = geometry.player1_keys
         else:
             player = self.player2
             other_player = self.player1
+            keys = geometry.player2_keys
 
-        self.history.append((
-            self.player1, self.player2, self.current_player
+        self.history = self.history.push((
+            self.player1, self.player2, self.current_player, self.key, self.move_masks, self.material, self.pattern_score,
+            self.pattern_indices
         ))
-
-        player = player ^ (1 << self._pos_to_int(from_x, from_y))
-        player = player ^ (1 << self._pos_to_int(to_x, to_y))
-
-        to_pos = (1 << self._pos_to_int(to_x, to_y))
-
-        to_pos = (((to_pos & self.invert(self.left_border)) << 1) |
-                  ((to_pos & self.invert(self.right_border)) >> 1) |
-                  (to_pos << self.size_x) |
-                  (to_pos >> self.size_x)) & other_player
-
-        player = player ^ to_pos
-        other_player = other_player ^ to_pos
-
-        to_pos = (((to_pos & self.invert(self.left_border)) << 1) & (to_pos << self.size_x) |
-                  ((to_pos & self.invert(self.left_border)) << 1) & (to_pos >> self.size_x) |
-                  ((to_pos & self.invert(self.right_border)) >> 1) & (to_pos << self.size_x) |
-                  ((to_pos & self.invert(self.right_border)) >> 1) & (to_pos >> self.size_x)) & other_player
-
-        player = player ^ to_pos
-        other_player = other_player ^ to_pos
+        self._count_repetition(self.key, 1)
+
+        key = self.key ^ keys[from_idx] ^ keys[to_idx] ^ SIDE_KEY
+
+        captured = geometry.neighbors[to_idx] & other_player
+        if captured:
+            for diagonal, pair in geometry.diagonal_pairs[to_idx]:
+                if captured & pair == pair:
+                    captured |= diagonal & other_player
+
+            b = captured
+            num_captured = 0
+            while b:
+                low = b & -b
+                key ^= geometry.flip_keys[low.bit_length() - 1]
+                b ^= low
+                num_captured += 1
+            # every captured piece changes sides
+            self.material += 2 * num_captured * self.current_player
+
+        player ^= (1 << from_idx) | (1 << to_idx) | captured
+        other_player ^= captured
+        self.key = key
 
         if self.current_player == Board.PLAYER1:
             self.player1 = player
@@ -189,20 +486,81 @@ class BitBoard(Board):
             self.player1 = other_player
             self.current_player = Board.PLAYER1
 
+        if self.move_masks is not None:
+            self._update_move_masks((1 << from_idx) | (1 << to_idx) | captured)
+
+        if self.pattern_weights is not None:
+            self.pattern_score, self.pattern_indices = self.pattern_weights.update(
+                self.pattern_score, self.pattern_indices, self.pattern_windows, from_idx, to_idx, captured,
+                1 if self.current_player == Board.PLAYER2 else 2)
+
+        if self.debug_evaluation:
+            self._check_material()
+        return self
+
+    def enable_incremental_moves(self):
+        """Keep the move masks of both players cached and only refresh the squares around each move.
+
+        Move generation, count_moves(), has_moves() and winner() then read the cache instead of shifting the whole
+        board, undo() restores the previous masks from history."""
+        self.incremental_moves = True
+        self.move_masks = (tuple(self._get_move_masks(self.player1)), tuple(self._get_move_masks(self.player2)))
         return self
 
+    def enable_patterns(self, weights):
+        """Keep pattern_score, the sum of a patterns.PatternWeights over all 3x3 windows, up to date in move/undo."""
+        self.pattern_weights = weights
+        self.pattern_windows = PatternWindows.get(self.size_x, self.size_y)
+        self.pattern_indices = weights.indices(self)
+        self.pattern_score = sum(weights.weights[i] for i in self.pattern_indices)
+        return self
+
+    def _spread(self, mask):
+        # squares one move away from mask, move directions come in opposite pairs so this works both ways
+        result = 0
+        for movable, shift in self.geometry.move_shifts:
+            if shift > 0:
+                result |= (mask & movable) << shift
+            else:
+                result |= (mask & movable) >> -shift
+        return result
+
+    def _update_move_masks(self, changed):
+        # a target can only change if it changed itself or one of its sources did, and the sources of those
+        # targets are one more step out
+        region = changed | self._spread(changed)
+        sources = region | self._spread(region)
+        keep = self.geometry.full ^ region
+
+        player1_masks, player2_masks = self.move_masks
+        self.move_masks = (
+            tuple((old & keep) | (new & region)
+                  for old, new in zip(player1_masks, self._get_move_masks(self.player1 & sources))),
+            tuple((old & keep) | (new & region)
+                  for old, new in zip(player2_masks, self._get_move_masks(self.player2 & sources))),
+        )
+
     def undo(self):
-        self.player1, self.player2, self.current_player = self.history[-1]
-        self.history = self.history[:-1]
+        (self.player1, self.player2, self.current_player, self.key, self.move_masks, self.material,
+         self.pattern_score, self.pattern_indices) = self.history.entry
+        self.history = self.history.parent
+
+        self._count_repetition(self.key, -1)
+
+        # positions from before enable_incremental_moves() or enable_patterns() have no cached state in history
+        if self.move_masks is None and self.incremental_moves:
+            self.enable_incremental_moves()
+        if self.pattern_score is None and self.pattern_weights is not None:
+            self.enable_patterns(self.pattern_weights)
+
+        if self.debug_evaluation:
+            self._check_material()
 
     def get_moves(self):
         if self._is_draw():
             return []
 
-        if self.current_player == Board.PLAYER1:
-            return self._get_moves_for(self.player1)
-        else:
-            return self._get_moves_for(self.player2)
+        return list(self._iter_masks(self._masks(self.current_player)))
 
     def get_moves_weighted_by_enemies(self):
         result = []
@@ -218,41 +576,109 @@ class BitBoard(Board):
         return result
 
     def get_num_occupied_fields(self, player):
-        if player == Board.PLAYER1:
-            return len(self._bit_scan(self.player1))
-        if player == Board.PLAYER2:
-            return len(self._bit_scan(self.player2))
+        return self.count_pieces(player)
 
-    def _get_moves_for(self, player):
-        empty = self.invert(self.player1 | self.player2)
+    def _player_bits(self, player):
+        return self.player1 if player == Board.PLAYER1 else self.player2
+
+    def count_pieces(self, player):
+        return popcount(self._player_bits(player))
+
+    def count_moves(self, player):
+        """Number of moves player would have if it was their turn, ignoring draws."""
+        return sum(popcount(targets) for targets in self._masks(player))
 
-        left_moves = (player ^ (player & self.left_border)) << 1 & empty
-        left_moves = [((point[0] + 1, point[1]), point) for point in self._bit_scan(left_moves)]
+    def has_moves(self, player):
+        return any(self._masks(player))
 
-        right_moves = (player ^ (player & self.right_border)) >> 1 & empty
-        right_moves = [((point[0] - 1, point[1]), point) for point in self._bit_scan(right_moves)]
+    def get_move_masks(self):
+        """Target squares of the current player per entry of DIRECTIONS."""
+        return list(self._masks(self.current_player))
+
+    def iter_moves(self):
+        if self._is_draw():
+            return iter(())
 
-        top_moves = (player ^ (player & self.top_border)) << self.size_x & empty
-        top_moves = [((point[0], point[1] + 1), point) for point in self._bit_scan(top_moves)]
+        return self._iter_masks(self._masks(self.current_player))
 
-        bottom_moves = (player ^ (player & self.bottom_border)) >> self.size_x & empty
-        bottom_moves = [((point[0], point[1] - 1), point) for point in self._bit_scan(bottom_moves)]
+    def _masks(self, player):
+        if self.move_masks is not None:
+            return self.move_masks[0] if player == Board.PLAYER1 else self.move_masks[1]
+        return self._get_move_masks(self._player_bits(player))
 
-        moves = left_moves + right_moves + top_moves + bottom_moves
+    def _get_move_masks(self, player):
+        g = self.geometry
+        empty = g.full ^ (self.player1 | self.player2)
+        size_x = self.size_x
+
+        masks = [
+            (player & g.not_left) << 1 & empty,
+            (player & g.not_right) >> 1 & empty,
+            (player & g.not_top) << size_x & empty,
+            (player & g.not_bottom) >> size_x & empty,
+        ]
 
         if self.allow_diagonals:
-            top_left = (player ^ (player & self.top_left)) << self.size_x+1 & empty
-            top_left = [((point[0] + 1, point[1] + 1), point) for point in self._bit_scan(top_left)]
+            masks.extend([
+                (player & g.not_top_left) << size_x+1 & empty,
+                (player & g.not_top_right) << size_x-1 & empty,
+                (player & g.not_bottom_left) >> size_x-1 & empty,
+                (player & g.not_bottom_right) >> size_x+1 & empty,
+            ])
 
-            top_right = (player ^ (player & self.top_right)) << self.size_x-1 & empty
-            top_right = [((point[0] - 1, point[1] + 1), point) for point in self._bit_scan(top_right)]
+        return masks
 
-            bottom_left = (player ^ (player & self.bottom_left)) >> self.size_x-1 & empty
-            bottom_left = [((point[0] + 1, point[1] - 1), point) for point in self._bit_scan(bottom_left)]
+    def get_moves_packed(self, with_captures=False):
+        if self._is_draw():
+            return []
 
-            bottom_right = (player ^ (player & self.bottom_right)) >> self.size_x+1 & empty
-            bottom_right = [((point[0] - 1, point[1] - 1), point) for point in self._bit_scan(bottom_right)]
+        return self._packed_moves(self.geometry.full, with_captures)
 
-            moves = moves + top_right + top_left + bottom_left + bottom_right
+    def get_captures_packed(self, with_captures=False):
+        """Packed moves of the current player that capture something, those whose target square is orthogonally
+        next to an enemy piece."""
+        if self._is_draw():
+            return []
 
+        return self._packed_moves(self._orthogonal_neighbors(self._player_bits(self.other_player)), with_captures)
+
+    def _orthogonal_neighbors(self, mask):
+        g = self.geometry
+        size_x = self.size_x
+        return ((mask & g.not_left) << 1 | (mask & g.not_right) >> 1 |
+                (mask & g.not_top) << size_x | (mask & g.not_bottom) >> size_x)
+
+    def _packed_moves(self, allowed, with_captures):
+        other_player = self.player2 if self.current_player == Board.PLAYER1 else self.player1
+
+        moves = []
+        for targets, packed in zip(self._masks(self.current_player), self.geometry.packed_table):
+            targets &= allowed
+            while targets:
+                low = targets & -targets
+                to_idx = low.bit_length() - 1
+                if with_captures:
+                    captured = self._captured(to_idx, other_player)
+                    captures = 0
+                    if captured:
+                        for bit, d in self.geometry.neighbor_directions[to_idx]:
+                            if captured & bit:
+                                captures |= 1 << d
+                    moves.append(packed[to_idx] | (captures << Board.CAPTURE_SHIFT))
+                else:
+                    moves.append(packed[to_idx])
+                targets ^= low
         return moves
+
+    def _iter_moves(self, player):
+        return self._iter_masks(self._get_move_masks(player))
+
+    def _iter_masks(self, masks):
+        for targets, moves in zip(masks, self.geometry.move_table):
+            while targets:
+                low = targets & -targets
+                yield moves[low.bit_length() - 1]
+                targets ^= low
+
+    def _get_moves_for(self, player):
+        return list(self._iter_moves(player))
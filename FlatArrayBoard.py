@@ -0,0 +1,249 @@
+from ArrayBoard import Board, History
+from zobrist import zobrist_keys, SIDE_KEY
+
+EMPTY, PLAYER1, PLAYER2, BORDER = 0, 1, 2, 3
+
+# board values for the cell codes and back
+VALUES = [Board.EMPTY, Board.PLAYER1, Board.PLAYER2, Board.EMPTY]
+CODES = {Board.EMPTY: EMPTY, Board.PLAYER1: PLAYER1, Board.PLAYER2: PLAYER2}
+
+
+class MailboxGeometry():
+    """Square numbering and neighbour tables for one board shape, shared by every board of that shape.
+
+    The board is stored row by row with one row/column of BORDER cells around it, so a neighbour of an on board
+    square is always a valid index and the tables only ever have to list squares on the board."""
+    _cache = {}
+
+    @classmethod
+    def get(cls, size_x, size_y, allow_diagonals=False):
+        shape = (size_x, size_y, allow_diagonals)
+        geometry = cls._cache.get(shape)
+        if geometry is None:
+            geometry = cls._cache[shape] = cls(size_x, size_y, allow_diagonals)
+        return geometry
+
+    def __reduce__(self):
+        # pickled boards (e.g. sent to worker processes) share the cached geometry on the other side
+        return MailboxGeometry.get, (self.size_x, self.size_y, self.allow_diagonals)
+
+    def __init__(self, size_x, size_y, allow_diagonals=False):
+        self.size_x = size_x
+        self.size_y = size_y
+        self.allow_diagonals = allow_diagonals
+        self.width = size_x + 2
+
+        self.empty_cells = bytearray([BORDER]) * (self.width * (size_y + 2))
+        self.squares = []
+        self.pos_index = {}
+        self.positions = [None] * len(self.empty_cells)
+        for y in range(size_y):
+            for x in range(size_x):
+                square = (y + 1) * self.width + x + 1
+                self.empty_cells[square] = EMPTY
+                self.squares.append(square)
+                self.pos_index[(x, y)] = square
+                self.positions[square] = (x, y)
+
+        # zobrist keys are shared with the other boards, they are indexed row-major
+        player1_keys, player2_keys = zobrist_keys(size_x * size_y)
+        self.player_keys = [None, [0] * len(self.empty_cells), [0] * len(self.empty_cells)]
+        self.flip_keys = [0] * len(self.empty_cells)
+        for idx, square in enumerate(self.squares):
+            self.player_keys[PLAYER1][square] = player1_keys[idx]
+            self.player_keys[PLAYER2][square] = player2_keys[idx]
+            self.flip_keys[square] = player1_keys[idx] ^ player2_keys[idx]
+
+        w = self.width
+        normal = [1, -1, w, -w]
+        diagonal = [w + 1, w - 1, -w + 1, -w - 1]
+        self.neighbors = [()] * len(self.empty_cells)
+        self.move_targets = [()] * len(self.empty_cells)
+        self.diagonal_pairs = [()] * len(self.empty_cells)
+        for square in self.squares:
+            on_board = lambda offsets: tuple(square + o for o in offsets if self.empty_cells[square + o] != BORDER)
+            self.neighbors[square] = on_board(normal)
+            self.move_targets[square] = on_board(normal + diagonal) if allow_diagonals else on_board(normal)
+            self.diagonal_pairs[square] = tuple(
+                (square + dx + dy, square + dx, square + dy)
+                for dx in [1, -1] for dy in [w, -w] if self.empty_cells[square + dx + dy] != BORDER)
+
+
+class FlatArrayBoard(Board):
+    """Array backend on a single flat bytearray.
+
+    Same rules and API as ArrayBoard, but the cells live in one padded buffer and all neighbour lookups come from
+    a precomputed MailboxGeometry, so copy() is a single buffer copy."""
+
+    def __init__(self, board, current_player, allow_diagonals=False):
+        self.allow_diagonals = allow_diagonals
+        self.geometry = MailboxGeometry.get(len(board[0]), len(board), allow_diagonals)
+        self.size_x = self.geometry.size_x
+        self.size_y = self.geometry.size_y
+
+        self.cells = bytearray(self.geometry.empty_cells)
+        for y, row in enumerate(board):
+            for x, field in enumerate(row):
+                self.cells[self.geometry.pos_index[(x, y)]] = CODES[field]
+
+        self.current_player = current_player
+        self.history = History()
+        self.key = self._compute_key()
+        self.material = self.count_pieces(Board.PLAYER1) - self.count_pieces(Board.PLAYER2)
+
+    @classmethod
+    def from_array(cls, board, current_player, allow_diagonals=False):
+        return cls(board, current_player, allow_diagonals=allow_diagonals)
+
+    @classmethod
+    def standard_board(cls, allow_diagonals=False, size_x=5, size_y=5):
+        return cls(Board.starting_array(size_x, size_y), Board.STANDARD_BEGINNING_PLAYER, allow_diagonals=allow_diagonals)
+
+    def copy(self):
+        board = FlatArrayBoard.__new__(FlatArrayBoard)
+        board.__dict__.update(self.__dict__)
+        board.cells = self.cells[:]
+        return board
+
+    @property
+    def other_player(self):
+        return Board.PLAYER2 if self.current_player == Board.PLAYER1 else Board.PLAYER1
+
+    @property
+    def board(self):
+        return [[self.value(x, y) for x in range(self.size_x)] for y in range(self.size_y)]
+
+    def value(self, x, y):
+        return VALUES[self.cells[self.geometry.pos_index[(x, y)]]]
+
+    def hash(self):
+        return self.key
+
+    def _compute_key(self):
+        key = SIDE_KEY if self.current_player == Board.PLAYER2 else 0
+        for square in self.geometry.squares:
+            code = self.cells[square]
+            if code != EMPTY:
+                key ^= self.geometry.player_keys[code][square]
+        return key
+
+    def _get_moves_for(self, player):
+        code = CODES[player]
+        cells = self.cells
+        positions = self.geometry.positions
+        move_targets = self.geometry.move_targets
+        moves = []
+        for square in self.geometry.squares:
+            if cells[square] == code:
+                for target in move_targets[square]:
+                    if cells[target] == EMPTY:
+                        moves.append((positions[square], positions[target]))
+        return moves
+
+    def get_moves(self):
+        return self._get_moves_for(self.current_player)
+
+    def get_moves_weighted_by_enemies(self):
+        other = CODES[self.other_player]
+        result = []
+        for move in self.get_moves():
+            to_square = self.geometry.pos_index[move[1]]
+            num_neighbors = sum(1 for n in self.geometry.neighbors[to_square] if self.cells[n] == other)
+            result.append((num_neighbors, move))
+        return result
+
+    def move(self, move):
+        from_square = self.geometry.pos_index.get(move[0])
+        to_square = self.geometry.pos_index.get(move[1])
+        if from_square is None or to_square is None:
+            return Board.INVALID_MOVE
+
+        if not self.cells[from_square] == CODES[self.current_player]:
+            return Board.INVALID_MOVE
+
+        if not self.cells[to_square] == EMPTY:
+            return Board.INVALID_MOVE
+
+        if not from_square in self.geometry.move_targets[to_square]:
+            return Board.INVALID_MOVE
+
+        return self._apply(from_square, to_square)
+
+    def apply(self, move):
+        """Plays a move without validating it, only use for moves returned by get_moves()."""
+        pos_index = self.geometry.pos_index
+        return self._apply(pos_index[move[0]], pos_index[move[1]])
+
+    def _apply(self, from_square, to_square):
+        geometry = self.geometry
+        cells = self.cells
+        player = CODES[self.current_player]
+        other = PLAYER2 if player == PLAYER1 else PLAYER1
+        keys = geometry.player_keys[player]
+        key = self.key ^ keys[from_square] ^ keys[to_square] ^ SIDE_KEY
+
+        cells[from_square] = EMPTY
+        cells[to_square] = player
+
+        changes = [n for n in geometry.neighbors[to_square] if cells[n] == other]
+        if changes:
+            for diagonal, a, b in geometry.diagonal_pairs[to_square]:
+                if cells[diagonal] == other and a in changes and b in changes:
+                    changes.append(diagonal)
+            for square in changes:
+                cells[square] = player
+                key ^= geometry.flip_keys[square]
+
+        self.history = self.history.push((from_square, to_square, changes, self.key, self.material))
+        self.key = key
+        self.material += 2 * len(changes) * self.current_player
+        self.current_player = self.other_player
+
+        if self.debug_evaluation:
+            self._check_material()
+        return self
+
+    def undo(self):
+        from_square, to_square, changes, self.key, self.material = self.history.entry
+        self.history = self.history.parent
+
+        other = CODES[self.current_player]
+        for square in changes:
+            self.cells[square] = other
+
+        self.current_player = self.other_player
+        self.cells[from_square] = CODES[self.current_player]
+        self.cells[to_square] = EMPTY
+
+        if self.debug_evaluation:
+            self._check_material()
+
+    def winner(self):
+        other_player = self.other_player
+        if not self.has_moves(self.current_player):
+            return other_player
+
+        if not self.has_moves(other_player):
+            return self.current_player
+
+        return Board.NO_WINNER
+
+    def get_num_occupied_fields(self, player):
+        return self.count_pieces(player)
+
+    def count_pieces(self, player):
+        return self.cells.count(CODES[player])
+
+    def count_moves(self, player):
+        return len(self._get_moves_for(player))
+
+    def has_moves(self, player):
+        code = CODES[player]
+        cells = self.cells
+        move_targets = self.geometry.move_targets
+        for square in self.geometry.squares:
+            if cells[square] == code:
+                for target in move_targets[square]:
+                    if cells[target] == EMPTY:
+                        return True
+        return False
@@ -1,8 +1,37 @@
+import itertools
+import pickle
+import random
+
+import pytest
+
 from ArrayBoard import ArrayBoard, Board
-from BitBoard import BitBoard
+from BitBoard import BitBoard, BitBoardGeometry
+from FlatArrayBoard import FlatArrayBoard
+from BatchBitBoard import BatchBitBoard
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+from negascout import NegaScout
+import patterns
+from negascout_parallel import ParallelNegaScout
+from proof_number import ProofNumberSearch, PROVEN, DISPROVEN, UNKNOWN
 
 
 class BoardTestRunner():
+    @staticmethod
+    def random_walk(board, seed, plies, packed=False):
+        """Applies up to plies random moves to board and yields each one once it is applied. Moves are picked from
+        the sorted moves, so a seed plays the same game on every backend."""
+        rng = random.Random(seed)
+        for _ in range(plies):
+            moves = sorted(board.get_moves_packed() if packed else board.get_moves())
+            if not moves:
+                return
+            move = rng.choice(moves)
+            if packed:
+                board.apply_packed(move)
+            else:
+                board.apply(move)
+            yield move
+
     def test_board_empty_moves(self):
         board = self.board.standard_board()
         moves = board.get_moves()
@@ -12,6 +41,24 @@ class BoardTestRunner():
         moves = board.get_moves()
         assert len(moves) == 18
 
+    def test_standard_board_sizes(self):
+        assert Board.starting_array() == Board.STANDARD_BOARD
+        assert Board.starting_array(8, 6) == [
+            [1, 1, 1, 0, 0, -1, -1, -1],
+            [1, 1, 1, 0, 0, -1, -1, -1],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [-1, -1, -1, 0, 0, 1, 1, 1],
+            [-1, -1, -1, 0, 0, 1, 1, 1],
+        ]
+
+        board = self.board.standard_board(size_x=7, size_y=4)
+        assert board.size_x == 7
+        assert board.size_y == 4
+        assert board.value(6, 3) == Board.PLAYER1
+        assert board.value(3, 3) == Board.EMPTY
+        assert board.count_pieces(Board.PLAYER2) == 6
+
     def test_board_valid_position(self):
         board = self.board.standard_board()
         assert board.valid_position(0, 0)
@@ -98,6 +145,36 @@ class BoardTestRunner():
         assert board.get_num_occupied_fields(Board.PLAYER1) == 7
         assert board.get_num_occupied_fields(Board.PLAYER2) == 9
 
+    def test_count_pieces_and_moves(self):
+        board = self.board.from_array(
+            board=[
+                [0, 1, 1, 0, 0],
+                [0, 1, 1, -1, -1],
+                [1, 1, 0, -1, -1],
+                [-1, 1, 0, 0, -1],
+                [-1, 0, -1, -1, 0]
+            ],
+            current_player=-1,
+            allow_diagonals=True
+        )
+
+        assert board.count_pieces(Board.PLAYER1) == 7
+        assert board.count_pieces(Board.PLAYER2) == 9
+        assert board.count_moves(Board.PLAYER2) == 19
+        assert board.count_moves(Board.PLAYER1) == 15
+        assert board.has_moves(Board.PLAYER1)
+
+        board = self.board.from_array([
+            [-1, 1, 1],
+            [-1, 1, 0],
+            [-1, 1, 1]
+        ],
+            Board.PLAYER1,
+            allow_diagonals=False
+        )
+        assert board.count_moves(Board.PLAYER2) == 0
+        assert not board.has_moves(Board.PLAYER2)
+
     def test_position(self):
         board = self.board.from_array(
             board=[
@@ -245,6 +322,123 @@ class BoardTestRunner():
         assert board.hash() == board2.hash()
 
 
+    def test_incremental_key(self):
+        board = self.board.standard_board(allow_diagonals=True)
+        keys = [board.key]
+        for _ in self.random_walk(board, 2, 30):
+            assert board.key == board._compute_key()
+            assert board.key == ArrayBoard.from_array(
+                [[board.value(x, y) for x in range(board.size_x)] for y in range(board.size_y)],
+                board.current_player).key
+            keys.append(board.key)
+
+        while len(keys) > 1:
+            keys.pop()
+            board.undo()
+            assert board.key == keys[-1]
+
+    def test_incremental_material(self):
+        board = self.board.standard_board(allow_diagonals=True)
+        board.debug_evaluation = True
+        for _ in self.random_walk(board, 3, 40):
+            assert board.material == board.count_pieces(Board.PLAYER1) - board.count_pieces(Board.PLAYER2)
+        while len(board.history):
+            board.undo()
+        assert board.material == 0
+
+        board.material += 1
+        with pytest.raises(AssertionError):
+            board.apply(board.get_moves()[0])
+
+
+    def test_copy_shares_history(self):
+        board = self.board.standard_board()
+        board.move(((1, 0), (2, 0)))
+        board_copy = board.copy()
+        board_copy.move(((3, 1), (2, 1)))
+
+        assert len(board.history) == 1
+        assert len(board_copy.history) == 2
+        assert board_copy.value(2, 0) == Board.PLAYER2
+
+        board_copy.undo()
+        board_copy.undo()
+        assert board_copy.key == self.board.standard_board().key
+        assert board.value(2, 0) == Board.PLAYER1
+        assert board.current_player == Board.PLAYER2
+
+
+    def test_pickle_long_game(self):
+        board = self.board.standard_board(allow_diagonals=True)
+        seed = 0
+        while len(board.history) < 400:
+            # a game that ended early is taken back a move and played on with another seed
+            if not list(self.random_walk(board, seed, 400 - len(board.history))):
+                board.undo()
+            seed += 1
+        copied = pickle.loads(pickle.dumps(board))
+        assert copied.key == board.key
+        assert list(copied.history) == list(board.history)
+
+        copied.undo()
+        board.undo()
+        assert copied.key == board.key
+
+    def test_apply_matches_array_board(self):
+        for allow_diagonals, (size_x, size_y) in itertools.product([False, True], [(5, 5), (6, 4), (3, 7), (8, 8), (9, 9)]):
+            for seed in range(10):
+                board = self.board.standard_board(allow_diagonals, size_x, size_y)
+                array_board = ArrayBoard.standard_board(allow_diagonals, size_x, size_y)
+                assert sorted(board.get_moves()) == sorted(array_board.get_moves())
+                for move in self.random_walk(board, seed, 40):
+                    array_board.apply(move)
+                    assert sorted(board.get_moves()) == sorted(array_board.get_moves())
+                    for y in range(board.size_y):
+                        for x in range(board.size_x):
+                            assert board.value(x, y) == array_board.value(x, y)
+
+    def test_packed_moves(self):
+        for size_x, size_y in [(5, 5), (7, 4)]:
+            board = self.board.standard_board(True, size_x, size_y)
+            array_board = ArrayBoard.standard_board(True, size_x, size_y)
+            for move in itertools.chain([None], self.random_walk(board, 5, 30, packed=True)):
+                if move is not None:
+                    assert board.pack_move(board.unpack_move(move)) == move
+                    array_board.apply(array_board.unpack_move(move))
+                    assert board.key == array_board.key
+
+                packed = board.get_moves_packed()
+                assert sorted(board.unpack_move(m) for m in packed) == sorted(board.get_moves())
+                assert sorted(board.get_moves_packed(with_captures=True)) == sorted(
+                    array_board.get_moves_packed(with_captures=True))
+                assert sorted(board.get_captures_packed(with_captures=True)) == sorted(
+                    m for m in array_board.get_moves_packed(with_captures=True) if Board.packed_captures(m))
+
+        board = self.board.standard_board()
+        assert board.move_packed(board.pack_move(((4, 0), (3, 0)))) == Board.INVALID_MOVE
+        assert not board.move_packed(board.pack_move(((1, 0), (2, 0)))) == Board.INVALID_MOVE
+        assert board.value(2, 0) == Board.PLAYER1
+
+    def test_packed_moves_board_size(self):
+        board = self.board.standard_board(True, 16, 16)
+        packed = board.get_moves_packed()
+        assert sorted(board.unpack_move(m) for m in packed) == sorted(board.get_moves())
+
+        # the from square has 8 bits, larger boards only play tuple moves
+        board = self.board.standard_board(False, 17, 17)
+        array_board = ArrayBoard.standard_board(False, 17, 17)
+        for move in self.random_walk(board, 1, 20):
+            array_board.apply(move)
+            assert sorted(board.get_moves()) == sorted(array_board.get_moves())
+        assert len(board.history) == 20
+        with pytest.raises(ValueError):
+            board.get_moves_packed()
+        with pytest.raises(ValueError):
+            board.get_captures_packed()
+        with pytest.raises(ValueError):
+            board.pack_move(board.get_moves()[0])
+
+
 class TestArrayBoard(BoardTestRunner):
     @classmethod
     def setup_class(cls):
@@ -301,6 +495,22 @@ class TestArrayBoard(BoardTestRunner):
         assert board.hash() == left.hash()
 
 
+class TestFlatArrayBoard(BoardTestRunner):
+    @classmethod
+    def setup_class(cls):
+        cls.board = FlatArrayBoard
+
+    def test_board_copy(self):
+        board = self.board.standard_board()
+        board_copy = board.copy()
+
+        assert not board.move(((1, 0), (2, 0))) == Board.INVALID_MOVE
+        assert board_copy.value(1, 0) == Board.PLAYER1
+        assert board_copy.value(2, 0) == Board.EMPTY
+        assert board_copy.current_player == Board.PLAYER1
+        assert board.cells is not board_copy.cells
+
+
 class TestBitboard(BoardTestRunner):
     @classmethod
     def setup_class(cls):
@@ -308,7 +518,452 @@ class TestBitboard(BoardTestRunner):
         usually contains tests)."""
         cls.board = BitBoard
 
+    def test_incremental_moves(self):
+        for allow_diagonals, (size_x, size_y) in itertools.product([False, True], [(5, 5), (7, 6)]):
+            board = self.board.standard_board(allow_diagonals, size_x, size_y).enable_incremental_moves()
+            snapshots = [board.move_masks]
+            for _ in self.random_walk(board, 6, 40, packed=True):
+                for player, masks in zip([board.player1, board.player2], board.move_masks):
+                    assert list(masks) == board._get_move_masks(player)
+                snapshots.append(board.move_masks)
+
+            while len(snapshots) > 1:
+                snapshots.pop()
+                board.undo()
+                assert board.move_masks == snapshots[-1]
+
+        # undoing moves made before enabling keeps the cache on
+        board = self.board.standard_board()
+        move = board.get_moves()[0]
+        board.move(move)
+        board.enable_incremental_moves()
+        board.undo()
+        assert list(board.move_masks[0]) == board._get_move_masks(board.player1)
+        board.move(move)
+        assert list(board.move_masks[1]) == board._get_move_masks(board.player2)
+
+    def test_patterns(self, tmp_path):
+        weights = patterns.default_weights()
+        board = BitBoard.standard_board(True, 6, 5).enable_patterns(weights)
+        assert board.pattern_score == 0
+        scores = [board.pattern_score]
+        for _ in self.random_walk(board, 6, 40):
+            assert board.pattern_indices == weights.indices(board)
+            assert board.pattern_score == weights.evaluate(board)
+            scores.append(board.pattern_score)
+        while len(scores) > 1:
+            scores.pop()
+            board.undo()
+            assert board.pattern_score == scores[-1]
+
+        # undoing moves made before enabling keeps the patterns on
+        board = BitBoard.standard_board(True, 6, 5)
+        move = board.get_moves()[0]
+        board.move(move)
+        board.enable_patterns(weights)
+        board.undo()
+        assert board.pattern_score == 0
+        board.move(move)
+        assert board.pattern_score == weights.evaluate(board)
+
+        # a piece is worth MATERIAL_WEIGHT, less one EXPOSED_WEIGHT per empty neighbour an enemy can move to:
+        # X is exposed from three sides, both O from two
+        board = BitBoard.from_string('''
+            .....
+            .O.O.
+            ..X..
+            .....
+            .....
+            ''', 'X')
+        m, e = patterns.MATERIAL_WEIGHT, patterns.EXPOSED_WEIGHT
+        assert weights.evaluate(board) == (m - 3 * e) - 2 * (m - 2 * e)
+
+        path = str(tmp_path / 'weights.bin')
+        patterns.save_weights(weights, path)
+        assert list(patterns.load_weights(path).weights) == list(weights.weights)
+
+    def test_geometry_shared(self):
+        board = self.board.standard_board(allow_diagonals=True)
+        assert board.geometry is self.board.standard_board(allow_diagonals=True).geometry
+        assert board.geometry is board.copy().geometry
+        assert board.geometry is not self.board.standard_board().geometry
+
+        for size_x, size_y in [(5, 5), (3, 4), (6, 2)]:
+            geometry = BitBoardGeometry.get(size_x, size_y)
+            assert geometry.right_border == int('1'.zfill(size_x) * size_y, 2)
+            assert geometry.left_border == int(bin(1 << size_x - 1)[2:] * size_y, 2)
+            assert geometry.top_border == int('1' * size_x, 2) << (size_x * (size_y - 1))
+            assert geometry.bottom_border == int('1' * size_x, 2)
+
     def test_bit_scan(self):
         bitBoard = self.board.standard_board()
         assert bitBoard._bit_scan(0b1100011000000000001100011) == [(0, 0), (1, 0), (0, 1), (1, 1), (3, 3), (4, 3),
                                                                    (3, 4), (4, 4)]
+
+    def test_iter_moves(self):
+        board = self.board.standard_board(allow_diagonals=True)
+        assert sorted(board.iter_moves()) == sorted(board.get_moves())
+        assert next(board.iter_moves()) in board.get_moves()
+        assert sum(bin(m).count('1') for m in board.get_move_masks()) == 18
+
+    def test_draw_by_repetition(self):
+        board = self.board.from_string(
+            """
+            X....
+            .....
+            .....
+            .....
+            ....O
+            """, 'X')
+        start = board.key
+
+        cycle = [((0, 0), (1, 0)), ((4, 4), (3, 4)), ((1, 0), (0, 0)), ((3, 4), (4, 4))]
+        assert not board.is_repetition()
+        for i in range(3):
+            for move in cycle:
+                assert not board.move(move) == Board.INVALID_MOVE
+            assert board.key == start
+            assert board.repetition_count() == i + 1
+
+        assert board._is_draw()
+        assert board.get_moves() == []
+        assert board.winner() == Board.DRAW
+
+        board_copy = board.copy()
+        board_copy.undo()
+        assert not board_copy._is_draw()
+        assert board._is_draw()
+
+    def test_copy_independent_of_game_length(self):
+        board = self.board.standard_board(size_x=8, size_y=8)
+        for _ in self.random_walk(board, 5, 300):
+            pass
+        assert len(board.history) > 2 * BitBoard.MAX_REPETITION_OVERLAY
+
+        # copies only take the changes since the shared base along, however long the game is
+        board_copy = board.copy()
+        for _ in range(10):
+            board_copy = board_copy.copy()
+            board_copy.apply(board_copy.get_moves()[0])
+            assert board_copy._repetition_base is board._repetition_base
+            assert len(board_copy._repetitions) <= BitBoard.MAX_REPETITION_OVERLAY
+
+        # undoing past the base counts down from it
+        board_copy = board.copy()
+        while len(board_copy.history):
+            board_copy.undo()
+            assert board_copy.repetition_count() == sum(entry[3] == board_copy.key for entry in board_copy.history)
+        assert board.repetition_count() == sum(entry[3] == board.key for entry in board.history)
+
+    def test_symmetries(self):
+        board = self.board.standard_board(allow_diagonals=True)
+        for _ in self.random_walk(board, 3, 7):
+            pass
+
+        array_board = ArrayBoard.from_array(
+            [[board.value(x, y) for x in range(board.size_x)] for y in range(board.size_y)], board.current_player)
+        rotated, array_rotated = board, array_board
+        for _ in range(4):
+            rotated, array_rotated = rotated.rotate_left(), array_rotated.rotate_left()
+            assert rotated.key == array_rotated.key
+
+        key, symmetry = board.canonical_key()
+        for s in BitBoard.SYMMETRIES:
+            transformed = board.transform(s)
+            assert transformed.canonical_key()[0] == key
+            assert transformed.count_pieces(Board.PLAYER1) == board.count_pieces(Board.PLAYER1)
+            assert sorted(transformed.get_moves()) == sorted(board.transform_move(m, s) for m in board.get_moves())
+            assert transformed.transform(BitBoard.INVERSE_SYMMETRY[s]).key == board.key
+        assert board.transform(symmetry).key == key
+
+        rectangle = self.board.standard_board(size_x=6, size_y=4)
+        assert rectangle.geometry.symmetries() == [BitBoard.IDENTITY, BitBoard.ROTATE_180, BitBoard.FLIP_X, BitBoard.FLIP_Y]
+        assert rectangle.transform(BitBoard.ROTATE_180).key == rectangle.key
+
+
+class TestBatchBitBoard():
+    @staticmethod
+    def perft(board, depth):
+        if depth == 0:
+            return 1
+        count = 0
+        for move in board.get_moves():
+            count += TestBatchBitBoard.perft(board.apply(move), depth - 1)
+            board.undo()
+        return count
+
+    def test_perft(self):
+        for allow_diagonals in [False, True]:
+            board = BitBoard.standard_board(allow_diagonals)
+            assert BatchBitBoard.from_boards([board]).perft(3) == self.perft(board, 3)
+
+    def test_random_moves_match_bitboard(self):
+        import numpy as np
+        rng = random.Random(4)
+        boards = []
+        for seed in range(100):
+            board = BitBoard.standard_board(True, 6, 6)
+            for _ in BoardTestRunner.random_walk(board, seed, rng.randint(0, 30)):
+                pass
+            boards.append(board)
+
+        batch = BatchBitBoard.from_boards(boards)
+        assert list(batch.count_moves()) == [board.count_moves(board.current_player) for board in boards]
+        assert list(batch.evaluate()) == [board.count_pieces(board.current_player) - board.count_pieces(board.other_player)
+                                          for board in boards]
+
+        from_idx, to_idx, has_move = batch.random_moves(np.random.RandomState(0))
+        batch.apply(from_idx, to_idx, has_move)
+        positions = batch.geometry.positions
+        for i, board in enumerate(boards):
+            move = (positions[from_idx[i]], positions[to_idx[i]])
+            assert move in board.get_moves()
+            board.apply(move)
+            assert (int(batch.player1[i]), int(batch.player2[i])) == (board.player1, board.player2)
+            assert batch.current_player[i] == board.current_player
+
+        # the legacy RandomState and the newer Generator both work
+        from_idx, to_idx, has_move = batch.random_moves(np.random.default_rng(0))
+        assert all(has_move == [board.has_moves(board.current_player) for board in boards])
+        for i, board in enumerate(boards):
+            if has_move[i]:
+                assert (positions[from_idx[i]], positions[to_idx[i]]) in board.get_moves()
+
+
+class TestTranspositionTable():
+    def test_store_and_probe(self):
+        table = TranspositionTable(1)
+        assert table.probe(12345) is None
+
+        table.store(12345, 4, EXACT, 7, 300)
+        assert table.probe(12345) == (4, EXACT, 7, 300)
+        table.store(12345, 2, UPPER, -3, None)
+        assert table.probe(12345) == (2, UPPER, -3, None)
+        assert len(table) == 1
+
+        table.clear()
+        assert table.probe(12345) is None
+        assert len(table) == 0
+
+    def test_replacement(self):
+        table = TranspositionTable(1)
+        deep, shallow, newer = 5, 5 + table.num_buckets, 5 + 2 * table.num_buckets
+
+        table.store(deep, 6, EXACT, 1, 1)
+        table.store(shallow, 2, EXACT, 2, 2)
+        assert table.probe(deep) == (6, EXACT, 1, 1)
+        assert table.probe(shallow) == (2, EXACT, 2, 2)
+
+        # a shallow entry only replaces the always replace slot
+        table.store(newer, 1, LOWER, 3, 3)
+        assert table.probe(deep) == (6, EXACT, 1, 1)
+        assert table.probe(shallow) is None
+
+        # a deeper entry takes the first slot and moves the old one over
+        table.store(shallow, 8, EXACT, 4, 4)
+        assert table.probe(shallow) == (8, EXACT, 4, 4)
+        assert table.probe(deep) == (6, EXACT, 1, 1)
+        assert table.probe(newer) is None
+
+    def test_generations(self):
+        table = TranspositionTable(1)
+        deep, other = 5, 5 + table.num_buckets
+
+        table.store(deep, 6, EXACT, 1, 1)
+        table.new_search()
+        assert table.probe(deep) == (6, EXACT, 1, 1)
+        assert (table.hits, table.previous_hits) == (1, 1)
+        assert table.probe(deep) == (6, EXACT, 1, 1)
+        assert (table.hits, table.previous_hits) == (2, 1)
+
+        # an entry from an older search loses the depth preferred slot even to a shallower one
+        table.new_search()
+        table.store(other, 2, EXACT, 2, 2)
+        table.store(other + table.num_buckets, 1, EXACT, 3, 3)
+        assert table.probe(other) == (2, EXACT, 2, 2)
+        assert table.probe(deep) is None
+
+    def test_shared_buffer(self):
+        buffer = bytearray(TranspositionTable.buffer_size(1))
+        table, other = TranspositionTable(buffer=buffer), TranspositionTable(buffer=buffer)
+        table.store(12345, 4, LOWER, -7, 300)
+        assert other.probe(12345) == (4, LOWER, -7, 300)
+
+        # a torn write, the data word changed but not the key word
+        slot = (12345 % table.num_buckets) << 1
+        table.data[slot] ^= 1
+        assert other.probe(12345) is None
+
+
+class TestNegaScout():
+    def test_time_limit(self):
+        board = BitBoard.standard_board(True)
+        search = NegaScout(max_depth=20, time_limit=0.2, check_every=64)
+        score, move = search.find_best_move(board)
+        assert move in board.get_moves()
+        assert 2 <= search.completed_depth < 20
+        assert search.deadline is None
+
+    def test_move_ordering_keeps_score(self):
+        rng = random.Random(2)
+        board = BitBoard.standard_board(True)
+        for _ in range(6):
+            plain = NegaScout(max_depth=3, use_deepening=False, use_table=False, use_table_move=False)
+            ordered = NegaScout(max_depth=3, use_deepening=False, use_move_ordering=True)
+            assert plain.find_best_move(board)[0] == ordered.find_best_move(board)[0]
+            assert ordered.cutoffs >= ordered.first_move_cutoffs > 0
+            board.apply(rng.choice(board.get_moves()))
+
+    def test_aspiration_and_pvs_keep_score(self):
+        rng = random.Random(7)
+        board = BitBoard.standard_board(True)
+        for _ in range(6):
+            plain = NegaScout(max_depth=4, use_deepening=False, use_table=False, use_table_move=False)
+            pvs = NegaScout(max_depth=4, use_move_ordering=True, use_principal_variation=True, use_aspiration=True,
+                            aspiration_window=1)
+            assert plain.find_best_move(board)[0] == pvs.find_best_move(board)[0]
+            assert [depth for depth, _ in pvs.iteration_nodes] == [2, 4]
+            board.apply(rng.choice(board.get_moves()))
+
+    def test_late_move_reductions(self):
+        board = BitBoard.standard_board(True)
+        plain = NegaScout(max_depth=6, use_move_ordering=True)
+        reduced = NegaScout(max_depth=6, use_move_ordering=True, use_reductions=True)
+        plain.find_best_move(board)
+        score, move = reduced.find_best_move(board)
+        assert move in board.get_moves()
+        assert reduced.reductions > reduced.reduction_researches
+        assert reduced.iteration_nodes[-1][1] < plain.iteration_nodes[-1][1]
+
+        # reductions deeper than the remaining depth stop at the leaves
+        for use_move_ordering in [False, True]:
+            search = NegaScout(4, use_deepening=False, use_move_ordering=use_move_ordering, use_reductions=True,
+                               reduction_min_depth=2, reduction=2)
+            assert search.find_best_move(board)[1] in board.get_moves()
+            assert search.reductions > 0
+
+    def test_mtdf(self):
+        rng = random.Random(8)
+        board = BitBoard.standard_board(True)
+        for _ in range(4):
+            plain = NegaScout(max_depth=4, use_deepening=False, use_table=False, use_table_move=False)
+            mtdf = NegaScout(max_depth=4, use_move_ordering=True)
+            score, move = mtdf.find_best_move_mtdf(board)
+            assert score == plain.find_best_move(board)[0]
+            assert move in board.get_moves()
+            assert [depth for depth, _ in mtdf.mtdf_passes] == [2, 4]
+            assert all(len(passes) >= 2 for _, passes in mtdf.mtdf_passes)
+            board.apply(rng.choice(board.get_moves()))
+
+    def test_quiescence(self):
+        board = BitBoard.from_string('''
+            X.O..
+            ...O.
+            .....
+            .....
+            .....
+            ''', 'X')
+        search = NegaScout(max_depth=1, use_deepening=False, use_quiescence=True)
+        # X may take the O at once, but O takes back, plain depth 1 only sees the first capture
+        assert NegaScout(max_depth=1, use_deepening=False).find_best_move(board)[0] == 1
+        assert search.find_best_move(board)[0] == -1
+        assert search.quiescence_nodes > 0
+
+    def test_parallel(self):
+        board = BitBoard.standard_board(True)
+        search = ParallelNegaScout(max_depth=4, num_workers=2, use_move_ordering=True)
+        try:
+            score, move = search.find_best_move(board)
+            assert move in board.get_moves()
+            assert sorted(r[0] for r in search.results) == [0, 1]
+            assert max(r[1] for r in search.results) == 4
+
+            # the root of a long game goes to the workers without the game played so far
+            seed = 0
+            while len(board.history) < 300 or not board.get_moves():
+                if not list(BoardTestRunner.random_walk(board, seed, 300)):
+                    board.undo()
+                seed += 1
+            score, move = search.find_best_move(board)
+            assert move in board.get_moves()
+            assert len(board.history) >= 300
+        finally:
+            search.close()
+
+
+class TestProofNumberSearch():
+    def test_proves_win(self):
+        board = BitBoard.from_string('''
+            .X..
+            O..O
+            ...X
+            ''', 'X')
+        result, line = ProofNumberSearch().solve(board)
+        assert result == PROVEN
+
+        # the line ends with the loser to move and stuck
+        for move in line:
+            assert move in board.get_moves()
+            board.move(move)
+        assert board.current_player == Board.PLAYER2
+        assert board.get_moves() == [] and not board._is_draw()
+
+    def test_disproves_loss_and_draw(self):
+        board = BitBoard.from_string('''
+            X.O..
+            ...O.
+            .....
+            .....
+            .....
+            ''', 'X')
+        assert ProofNumberSearch().solve(board)[0] == DISPROVEN
+
+        # neither side can force a capture, both only hold the draw
+        for player in 'XO':
+            board = BitBoard.from_string('''
+                X..O
+                ....
+                O..X
+                ''', player)
+            assert ProofNumberSearch().solve(board)[0] == DISPROVEN
+
+    def test_repetition(self):
+        board = BitBoard.from_string('''
+            X....
+            .....
+            .....
+            .....
+            ....O
+            ''', 'X')
+        expected = ProofNumberSearch().solve(board)[0]
+        cycle = [((0, 0), (1, 0)), ((4, 4), (3, 4)), ((1, 0), (0, 0)), ((3, 4), (4, 4))]
+        for i in range(3):
+            # repeated positions before the root do not change the result until the game is drawn
+            assert ProofNumberSearch().solve(board)[0] == expected
+            for move in cycle:
+                board.move(move)
+        assert board._is_draw()
+        assert ProofNumberSearch().solve(board) == (DISPROVEN, [])
+
+    def test_repetition_disproofs_reused(self):
+        # a draw held by repeating positions, disproofs relying on repetitions have to be reused on other paths
+        board = BitBoard.from_string('''
+            .OX
+            .XO
+            ...
+            ''', 'O', allow_diagonals=True)
+        solver = ProofNumberSearch(max_nodes=100000)
+        assert solver.solve(board) == (DISPROVEN, [])
+        assert solver.nodes < 100000
+
+    def test_limits(self):
+        board = BitBoard.from_string('''
+            X..O
+            ....
+            O..X
+            ''', 'X')
+        assert ProofNumberSearch(max_nodes=10).solve(board) == (UNKNOWN, [])
+
+        solver = ProofNumberSearch(max_entries=64)
+        assert solver.solve(board)[0] == DISPROVEN
+        assert len(solver.table) + len(solver.dependent) <= 64
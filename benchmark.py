@@ -0,0 +1,182 @@
+import contextlib
+import io
+import multiprocessing
+import random
+import time
+
+from ArrayBoard import ArrayBoard
+from BitBoard import BitBoard
+from FlatArrayBoard import FlatArrayBoard
+from negascout import NegaScout
+from negascout_parallel import ParallelNegaScout
+from proof_number import ProofNumberSearch, PROVEN, UNKNOWN
+
+SIZES = [(5, 5), (6, 6), (7, 7), (8, 8)]
+
+
+def sample_positions(board_class, size_x, size_y, allow_diagonals, num_positions=200, seed=0):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < num_positions:
+        board = board_class.standard_board(allow_diagonals, size_x, size_y)
+        for _ in range(rng.randint(0, 40)):
+            moves = board.get_moves()
+            if not moves:
+                break
+            board.apply(rng.choice(moves))
+        positions.append(board)
+    return positions
+
+
+def move_generation_speed(positions, min_time=0.5):
+    calls = 0
+    t0 = time.time()
+    while time.time() - t0 < min_time:
+        for board in positions:
+            board.get_moves()
+        calls += len(positions)
+    return calls / (time.time() - t0)
+
+
+def search_speed(board, depth):
+    with contextlib.redirect_stdout(io.StringIO()):
+        search = NegaScout(depth, use_deepening=False)
+        t0 = time.time()
+        search.find_best_move(board)
+    return search.moves_looked_at / (time.time() - t0)
+
+
+def _walk(board, depth, evaluate):
+    # full width tree walk doing what a search does per node: generate moves, and at the leaves score mobility
+    if depth == 0:
+        if evaluate:
+            board.count_moves(board.current_player) - board.count_moves(board.other_player)
+        return 1
+    nodes = 1
+    for move in board.get_moves_packed():
+        nodes += _walk(board.apply_packed(move), depth - 1, evaluate)
+        board.undo()
+    return nodes
+
+
+def incremental_speed(allow_diagonals=False, depth=3):
+    print("incremental move masks vs full regeneration, allow_diagonals={} depth={}".format(allow_diagonals, depth))
+    print("{:>6} {:>10} {:>16} {:>16}".format("size", "eval", "full nodes/s", "incremental/s"))
+    for size_x, size_y in SIZES:
+        for evaluate in [False, True]:
+            speeds = []
+            for incremental in [False, True]:
+                board = BitBoard.standard_board(allow_diagonals, size_x, size_y)
+                if incremental:
+                    board.enable_incremental_moves()
+                t0 = time.time()
+                nodes = _walk(board, depth, evaluate)
+                speeds.append(nodes / (time.time() - t0))
+            print("{:>6} {:>10} {:>16.0f} {:>16.0f}".format(
+                "{}x{}".format(size_x, size_y), "mobility" if evaluate else "none", speeds[0], speeds[1]))
+
+
+def smp_speedup(depth=8, worker_counts=(1, 2, 4, 8), allow_diagonals=True, num_positions=4):
+    """Time for the lazy SMP search to complete depth, with a fresh table per position."""
+    print("lazy SMP time to depth {}, allow_diagonals={}, {} cores".format(depth, allow_diagonals, multiprocessing.cpu_count()))
+    print("{:>8} {:>12} {:>10}".format("workers", "seconds", "speedup"))
+    positions = sample_positions(BitBoard, 5, 5, allow_diagonals, num_positions, seed=1)
+    baseline = None
+    for num_workers in worker_counts:
+        with contextlib.redirect_stdout(io.StringIO()):
+            search = ParallelNegaScout(depth, num_workers, use_move_ordering=True, use_principal_variation=True)
+            t0 = time.time()
+            for board in positions:
+                search.new_game()
+                search.find_best_move(board)
+            seconds = time.time() - t0
+            search.close()
+        baseline = baseline or seconds
+        print("{:>8} {:>12.2f} {:>10.2f}".format(num_workers, seconds, baseline / seconds))
+
+
+def mtdf_speed(depth=8, allow_diagonals=True, num_positions=10):
+    """Nodes and time of MTD(f) against the PVS deepening loop on the same positions."""
+    print("MTD(f) vs PVS deepening, depth {}, allow_diagonals={}".format(depth, allow_diagonals))
+    print("{:>16} {:>10} {:>12} {:>8}".format("driver", "seconds", "nodes", "passes"))
+    positions = sample_positions(BitBoard, 5, 5, allow_diagonals, num_positions, seed=2)
+    for name in ["pvs", "pvs+aspiration", "mtdf"]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            search = NegaScout(depth, use_move_ordering=True, use_principal_variation=name != "mtdf",
+                               use_aspiration=name == "pvs+aspiration")
+            nodes = passes = 0
+            t0 = time.time()
+            for board in positions:
+                search.new_game()
+                if name == "mtdf":
+                    search.find_best_move_mtdf(board)
+                    passes += sum(len(p) for _, p in search.mtdf_passes)
+                else:
+                    search.find_best_move(board)
+                nodes += sum(n for _, n in search.iteration_nodes)
+            seconds = time.time() - t0
+        print("{:>16} {:>10.2f} {:>12} {:>8}".format(name, seconds, nodes, passes))
+
+
+def endgame_positions(size_x, size_y, allow_diagonals, pieces=2, num_positions=20, seed=0):
+    # random positions with a few pieces of each player, the ones already over are skipped
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < num_positions:
+        squares = rng.sample(range(size_x * size_y), 2 * pieces)
+        board = [[ArrayBoard.EMPTY] * size_x for _ in range(size_y)]
+        for i, square in enumerate(squares):
+            board[square // size_x][square % size_x] = ArrayBoard.PLAYER1 if i % 2 == 0 else ArrayBoard.PLAYER2
+        position = BitBoard.from_array(board, rng.choice([ArrayBoard.PLAYER1, ArrayBoard.PLAYER2]), allow_diagonals)
+        if position.get_moves():
+            positions.append(position)
+    return positions
+
+
+def solver_speed(max_depth=12, allow_diagonals=False, pieces=3, num_positions=10, max_nodes=50000):
+    """Endgames settled (won or lost for sure) by the proof-number solver against NegaScout deepening to max_depth."""
+    print("proof-number solver vs NegaScout up to depth {}, allow_diagonals={}".format(max_depth, allow_diagonals))
+    print("{:>10} {:>8} {:>8} {:>10}".format("search", "settled", "wins", "seconds"))
+    positions = endgame_positions(5, 5, allow_diagonals, pieces, num_positions, seed=1)
+
+    solver = ProofNumberSearch(max_nodes)
+    t0 = time.time()
+    results = [solver.solve(board)[0] for board in positions]
+    print("{:>10} {:>8} {:>8} {:>10.2f}".format(
+        "pns", len(results) - results.count(UNKNOWN), results.count(PROVEN), time.time() - t0))
+
+    # a disproof settles a position as not won, draws included, NegaScout only settles the wins and losses it sees
+    scores = []
+    t0 = time.time()
+    for board in positions:
+        for depth in range(2, max_depth + 1, 2):
+            with contextlib.redirect_stdout(io.StringIO()):
+                score, _ = NegaScout(depth, use_move_ordering=True, use_principal_variation=True).find_best_move(board)
+            if score is not None and abs(score) >= 9999999:
+                break
+        scores.append(score or 0)
+    print("{:>10} {:>8} {:>8} {:>10.2f}".format(
+        "negascout", sum(1 for s in scores if abs(s) >= 9999999), sum(1 for s in scores if s >= 9999999),
+        time.time() - t0))
+
+
+def run(allow_diagonals=False, depth=4):
+    print("allow_diagonals={} search depth={}".format(allow_diagonals, depth))
+    print("{:>6} {:>14} {:>18} {:>18}".format("size", "board", "get_moves/s", "search nodes/s"))
+    for size_x, size_y in SIZES:
+        for board_class in [ArrayBoard, FlatArrayBoard, BitBoard]:
+            positions = sample_positions(board_class, size_x, size_y, allow_diagonals)
+            moves_per_second = move_generation_speed(positions)
+            nodes_per_second = search_speed(board_class.standard_board(allow_diagonals, size_x, size_y), depth)
+            print("{:>6} {:>14} {:>18.0f} {:>18.0f}".format(
+                "{}x{}".format(size_x, size_y), board_class.__name__, moves_per_second, nodes_per_second))
+
+
+if __name__ == '__main__':
+    run(allow_diagonals=False)
+    run(allow_diagonals=True)
+    incremental_speed(allow_diagonals=False)
+    incremental_speed(allow_diagonals=True)
+    mtdf_speed()
+    solver_speed()
+    smp_speedup()
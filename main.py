@@ -5,6 +5,7 @@ from monte_carlo import MonteCarloTreeSearch
 from negascout import NegaScout
 
 from display import print_board
+import time
 
 
 board = BitBoard.standard_board(allow_diagonals=True)
@@ -25,8 +26,10 @@ while True:
         score, move = mcmc.find_best_move(board)
         print("MCMC score: {}, moves_searched: {}".format(score, mcmc.moves_looked_at))
     else:
+        t0 = time.time()
         score, move = alphabeta.find_best_move(board)
-        print("Negascout score: {}, moves_searched: {}".format(score, alphabeta.moves_looked_at))
+        print("Negascout score: {}, moves_searched: {}, table hits from earlier moves: {}, time: {:.2f}s".format(
+            score, alphabeta.moves_looked_at, alphabeta.transposition_table.previous_hits, time.time() - t0))
 
     board.move(move)
     print_board(board)
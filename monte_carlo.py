@@ -7,20 +7,31 @@ from ArrayBoard import ArrayBoard
 
 class MonteCarloTreeSearch():
 
-    def fully_expanded(self, moves, plays, board):
-      return all((move, board.current_player, board.hash()) in plays for move in moves)
+    def __init__(self, use_symmetry=False):
+        # with use_symmetry (BitBoard only) symmetric positions share their statistics
+        self.use_symmetry = use_symmetry
 
-    def best_uct(self, moves, wins, plays, board): 
+    def stat_keys(self, moves, board):
+        if self.use_symmetry:
+            key, symmetry = board.canonical_key()
+            return [(board.pack_move(board.transform_move(board.unpack_move(move), symmetry)), board.current_player, key)
+                    for move in moves]
+        return [(move, board.current_player, board.key) for move in moves]
+
+    def fully_expanded(self, keys, plays):
+      return all(key in plays for key in keys)
+
+    def best_uct(self, moves, keys, wins, plays):
         log_total = np.log(sum(plays.values()))
 
         weighted_moves = []
-        for move in moves:
-            positions_won = wins[(move, board.current_player, board.hash())]
-            times_played = plays[(move, board.current_player, board.hash())]
+        for move, key in zip(moves, keys):
+            positions_won = wins[key]
+            times_played = plays[key]
 
             score = positions_won/times_played + 1.4 * np.sqrt(log_total/times_played)
 
-            weighted_moves.append((score, move))
+            weighted_moves.append((score, move, key))
 
         return max(weighted_moves)
     
@@ -43,31 +54,33 @@ class MonteCarloTreeSearch():
             depth = 0
 
             while True:
-                moves = board.get_moves()
+                moves = board.get_moves_packed()
                 if not moves: 
                     break
 
-                if self.fully_expanded(moves, plays, board):
-                    score, move = self.best_uct(moves, wins, plays, board)
+                keys = self.stat_keys(moves, board)
+                if self.fully_expanded(keys, plays):
+                    score, move, key = self.best_uct(moves, keys, wins, plays)
                     #print("UTC move {}, score {}".format(move, score))
-                    visited_states.add((move, board.current_player, board.hash()))
+                    visited_states.add(key)
                     depth += 1
-                    board.move(move)
+                    board.apply_packed(move)
                 else:
-                    move = moves[np.random.choice(len(moves))]
-                    if not (move, board.current_player, board.hash()) in plays:
+                    choice = np.random.choice(len(moves))
+                    move, key = moves[choice], keys[choice]
+                    if not key in plays:
                         #print("Unknown node {}, expanding".format(move))
-                        visited_states.add((move, board.current_player, board.hash()))
+                        visited_states.add(key)
                         break
                     else:
                         #print("Known node {}".format(move))
-                        visited_states.add((move, board.current_player, board.hash()))
-                        board.move(move)
+                        visited_states.add(key)
+                        board.apply_packed(move)
                         depth += 1
             
             if moves:
                 depth += 1
-                num_moves, winner = self._simulate(board.move(move), rollout=False)
+                num_moves, winner = self._simulate(board.apply_packed(move), rollout=False)
                 depth+=num_moves
                 #print("Winner for {} is {}".format(move, winner))
                 simul_moves.append(num_moves)
@@ -83,11 +96,10 @@ class MonteCarloTreeSearch():
                 if player == winner:
                     wins[(move, player, state)] += 1
 
-        moves = original_board.get_moves()
+        moves = original_board.get_moves_packed()
         best_move = None
         best_score = 0
-        for move in moves:
-            key = (move, original_board.current_player, original_board.hash())
+        for move, key in zip(moves, self.stat_keys(moves, original_board)):
             if not key in plays:
                 continue
             score = wins[key]/plays[key]
@@ -98,7 +110,7 @@ class MonteCarloTreeSearch():
 
         print("Monte Carlo Stats, num_positions: {}, num_plays: {}, max_depth {}".format(len(plays), sum(plays.values()), max_depth))
         self.moves_looked_at = sum(plays.values())
-        return best_score, best_move
+        return best_score, original_board.unpack_move(best_move) if best_move is not None else None
 
     def _simulate(self, board, rollout=True):
         if rollout:
@@ -114,9 +126,9 @@ class MonteCarloTreeSearch():
                 score, move = moves[np.random.choice(len(moves), p=[(x[0]*50+1)/total_score for x in moves])]
                 #move = moves[np.random.choice(len(moves))]
                 num_moves+=1
-                board.move(move)
+                board.apply(move)
         else:
-            score = board.get_num_occupied_fields(board.current_player) - board.get_num_occupied_fields(board.other_player)
+            score = board.count_pieces(board.current_player) - board.count_pieces(board.other_player)
             return 0, board.current_player if score > 0 else board.other_player
 
 
@@ -23,7 +23,7 @@ def find_best_move(board):
     best_move, best_score = None, 0
 
     for move in moves:
-        key = (move, board.current_player, board.hash())
+        key = (move, board.current_player, board.key)
         if not key in plays:
             continue
 
@@ -39,15 +39,15 @@ def find_best_move(board):
     return best_score, best_move
 
 def fully_expanded(moves, plays, board):
-  return all((move, board.current_player, board.hash()) in plays for move in moves)
+  return all((move, board.current_player, board.key) in plays for move in moves)
 
 def best_uct(moves, wins, plays, board): 
     log_total = np.log(sum(plays.values()))
 
     weighted_moves = []
     for move in moves:
-        positions_won = wins[(move, board.current_player, board.hash())]
-        times_played = plays[(move, board.current_player, board.hash())]
+        positions_won = wins[(move, board.current_player, board.key)]
+        times_played = plays[(move, board.current_player, board.key)]
 
         score = positions_won/times_played + 1.4 * np.sqrt(log_total/times_played)
 
@@ -81,20 +81,20 @@ def run(board):
             if fully_expanded(moves, plays, board):
                 score, move = best_uct(moves, wins, plays, board)
                 #print("UTC move {}, score {}".format(move, score))
-                visited_states.add((move, board.current_player, board.hash()))
-                board.move(move)
+                visited_states.add((move, board.current_player, board.key))
+                board.apply(move)
             else:
                 move = moves[np.random.choice(len(moves))]
-                if not (move, board.current_player, board.hash()) in plays:
+                if not (move, board.current_player, board.key) in plays:
                     #print("Unknown node {}, expanding".format(move))
-                    visited_states.add((move, board.current_player, board.hash()))
+                    visited_states.add((move, board.current_player, board.key))
                     break
                 else:
                     #print("Known node {}".format(move))
-                    visited_states.add((move, board.current_player, board.hash()))
-                    board.move(move)
+                    visited_states.add((move, board.current_player, board.key))
+                    board.apply(move)
         
-        num_moves, winner = _simulate(board.move(move))
+        num_moves, winner = _simulate(board.apply(move))
         #print("Winner for {} is {}".format(move, winner))
         simul_moves.append(num_moves)
 
@@ -120,7 +120,7 @@ def _simulate(board):
         score, move = moves[np.random.choice(len(moves), p=[(x[0]*50+1)/total_score for x in moves])]
         #move = moves[np.random.choice(len(moves))]
         num_moves+=1
-        board.move(move)
+        board.apply(move)
 
 pool = multiprocessing.Pool(10)
 if __name__ == '__main__':
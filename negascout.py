@@ -1,22 +1,67 @@
 from display import print_board
+from ArrayBoard import Board
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
 import random
 import time
 
+
+# number of captured pieces for the capture bits of a packed move
+CAPTURE_COUNTS = [bin(i).count('1') for i in range(256)]
+KILLER_SCORE = 1 << 20
+CAPTURE_SCORE = 1 << 21
+
+
+class SearchTimeout(Exception):
+    pass
+
+
 class NegaScout():
 
-    def __init__(self, max_depth=6, use_deepening=True, use_table=True, use_move_ordering=False, use_principal_variation=False):
+    def __init__(self, max_depth=6, use_deepening=True, use_table=True, use_move_ordering=False, use_principal_variation=False, use_symmetry=False, table_size_mb=16,
+                 time_limit=None, check_every=1024, use_table_move=True, use_aspiration=False, aspiration_window=2,
+                 transposition_table=None, use_quiescence=False, quiescence_depth=4,
+                 pattern_weights=None, use_reductions=False, reduction_after=3, reduction_min_depth=3, reduction=2):
         self.moves_looked_at = 0
+        self.reductions = 0
+        self.reduction_researches = 0
+        self.mtdf_passes = []
+        self.quiescence_nodes = 0
+        self.researches = 0
+        self.iteration_nodes = []
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
         self.exact_hits = 0
         self.beta_hits = 0
         self.pv_searches = 0
         self.pv_searches_beta = 0
 
-        self.transposition_table = {}
+        self.transposition_table = transposition_table if transposition_table is not None else TranspositionTable(table_size_mb)
         self.max_depth = max_depth
         self.use_table = use_table
         self.use_deepening = use_deepening
         self.use_move_ordering = use_move_ordering
         self.use_principal_variation = use_principal_variation
+        self.use_symmetry = use_symmetry
+        self.use_table_move = use_table_move
+        self.use_aspiration = use_aspiration
+        self.use_quiescence = use_quiescence
+        self.quiescence_depth = quiescence_depth
+        self.pattern_weights = pattern_weights
+        self.use_reductions = use_reductions
+        self.reduction_after = reduction_after
+        self.reduction_min_depth = reduction_min_depth
+        self.reduction = reduction
+        self.aspiration_window = aspiration_window
+        self.time_limit = time_limit
+        self.check_every = check_every
+        self.deadline = None
+        # set by the parallel search, a buffer whose first byte is set to stop all searches
+        self.stop_flag = None
+        self.branching_factor = None
+        self.completed_depth = 0
+        self.root_depth = 0
+        self.killers = []
+        self.history = []
 
         print("""
         Initializing Negascout:
@@ -24,55 +69,295 @@ class NegaScout():
         Use HashTable: {use_table}
         Use Iterative Deepening: {use_deepening}
         Use Move Ordering: {use_move_ordering}
+        Use Table Move: {use_table_move}
         Use Principal Variation: {use_principal_variation}
-        """.format(max_depth=max_depth, use_table=use_table, use_deepening=use_deepening, use_move_ordering=use_move_ordering, use_principal_variation=use_principal_variation))
-
-
-
-    def find_best_move(self, board):
-        self.transposition_table = {}
+        Use Aspiration Windows: {use_aspiration}
+        Use Quiescence: {use_quiescence}
+        Use Patterns: {use_patterns}
+        Use Late Move Reductions: {use_reductions}
+        Use Symmetry: {use_symmetry}
+        Table Size: {table_size_mb} MB
+        Time Limit: {time_limit}
+        """.format(max_depth=max_depth, use_table=use_table, use_deepening=use_deepening, use_move_ordering=use_move_ordering, use_principal_variation=use_principal_variation, use_symmetry=use_symmetry, table_size_mb=table_size_mb, time_limit=time_limit, use_table_move=use_table_move, use_aspiration=use_aspiration, use_quiescence=use_quiescence, use_patterns=pattern_weights is not None, use_reductions=use_reductions))
+
+
+
+    def new_game(self):
+        """Forgets everything searched so far, the table is otherwise kept between find_best_move calls."""
+        self.transposition_table.clear()
+
+    def find_best_move(self, board, time_limit=None, start_depth=2):
+        """Best (score, move) for the side to move.
+
+        With a time limit (seconds, per call or set on the searcher) iterative deepening stops once the next depth is
+        not expected to finish in time, or aborts the running depth at the deadline, and the result of the last
+        completed depth is returned. The first depth is always completed unless the stop flag is set, then the
+        result is (None, None)."""
+        self.transposition_table.new_search()
+        root = board
         board = board.copy()
+        if self.pattern_weights is not None:
+            board.enable_patterns(self.pattern_weights)
 
         self.moves_looked_at = 0
+        time_limit = time_limit if time_limit is not None else self.time_limit
+        self._reset_ordering()
 
-        if self.use_deepening:
+        if self.use_deepening or time_limit is not None:
             t0 = time.time()
             print("Start Iterative Deepening")
-            for i in range(2, self.max_depth+1, 2):
+            self.deadline = None
+            self.branching_factor = None
+            self.completed_depth = 0
+            result = None
+            nodes = []
+            self.iteration_nodes = []
+            for i in range(start_depth, self.max_depth+1, 2):
+                if time_limit is not None and nodes:
+                    if len(nodes) > 1:
+                        # two plies per iteration, estimate the time of the next one from the growth so far
+                        growth = nodes[-1] / max(nodes[-2], 1)
+                        self.branching_factor = growth ** 0.5
+                        elapsed = time.time() - t0
+                        if elapsed + iteration_time * growth > time_limit:
+                            print("Stopping before depth", i, "estimated branching factor", self.branching_factor)
+                            break
+                    self.deadline = t0 + time_limit
+
                 self.moves_looked_at = 0
                 self.exact_hits = 0
                 self.beta_hits = 0
                 self.pv_searches = 0
-                score, move = self._negascout(board, i, -1000000, 1000000)
-                print(i, score, move, self.moves_looked_at, self.exact_hits, self.beta_hits, self.pv_searches, self.pv_searches_beta, len(self.transposition_table), time.time()-t0)
-
-            return score, move
+                self.cutoffs = 0
+                self.first_move_cutoffs = 0
+                self.researches = 0
+                self.quiescence_nodes = 0
+                self.reductions = 0
+                self.reduction_researches = 0
+                self.root_depth = i
+                t1 = time.time()
+                try:
+                    if self.use_aspiration and result is not None:
+                        score, move = self._aspiration_search(board, i, result[0])
+                    else:
+                        score, move = self._negascout(board, i, -1000000, 1000000)
+                except SearchTimeout:
+                    print("Timeout at depth", i, "after", self.moves_looked_at, "nodes")
+                    break
+                iteration_time = time.time() - t1
+                nodes.append(self.moves_looked_at)
+                self.iteration_nodes.append((i, self.moves_looked_at))
+                result = score, move
+                self.completed_depth = i
+                print(i, score, self._unpack(root, move), self.moves_looked_at, self.exact_hits, self.beta_hits, self.pv_searches, self.pv_searches_beta, len(self.transposition_table), self.transposition_table.previous_hits, self.first_move_cutoff_rate(), self.researches, self.quiescence_nodes, self.reductions, self.reduction_researches, time.time()-t0)
+
+            self.deadline = None
+            if result is None:
+                return None, None
+            score, move = result
+            return score, self._unpack(root, move)
         else:
-            return self._negascout(board, self.max_depth, -1000000, 1000000)
+            self.root_depth = self.max_depth
+            score, move = self._negascout(board, self.max_depth, -1000000, 1000000)
+            return score, self._unpack(root, move)
+
+    def _quiescence(self, board, alpha, beta, depth):
+        """Plays out captures at the leaves so they are not scored in the middle of an exchange.
+
+        The side to move may always stand pat on the static score, at most depth captures are searched."""
+        self.quiescence_nodes += 1
+        best_score = self._evaluate(board)
+        if best_score >= beta or depth == 0:
+            return best_score
+        alpha = max(alpha, best_score)
+
+        moves = board.get_captures_packed(with_captures=True)
+        moves.sort(key=lambda move: -CAPTURE_COUNTS[move >> Board.CAPTURE_SHIFT])
+        for move in moves:
+            score = -self._quiescence(board.apply_packed(move), -beta, -alpha, depth-1)
+            board.undo()
+            if score >= beta:
+                return score
+            if score > best_score:
+                best_score = score
+                alpha = max(alpha, score)
+        return best_score
+
+    def _aspiration_search(self, board, depth, guess):
+        """Searches with a window around the score of the previous iteration, widening it on the failing side."""
+        delta = self.aspiration_window
+        alpha, beta = guess - delta, guess + delta
+        while True:
+            score, move = self._negascout(board, depth, alpha, beta)
+            if score <= alpha and alpha > -1000000:
+                alpha = max(alpha - delta, -1000000)
+            elif score >= beta and beta < 1000000:
+                beta = min(beta + delta, 1000000)
+            else:
+                return score, move
+            self.researches += 1
+            delta *= 2
+
+    def first_move_cutoff_rate(self):
+        """Share of beta cutoffs that happened on the first move searched, a measure of the move ordering."""
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def _reset_ordering(self):
+        # killers are per ply and only make sense for one root position, history is kept but halved
+        self.killers = [[None, None] for _ in range(self.max_depth + 1)]
+        if not self.history:
+            # one entry per packed move without captures, boards refuse sizes whose moves would not fit
+            self.history = [0] * (1 << Board.CAPTURE_SHIFT)
+        else:
+            self.history = [h >> 1 for h in self.history]
+
+    def _order_moves(self, moves, ply):
+        """Captures by number of captured pieces, then killer moves, then quiet moves by history score."""
+        killers = self.killers[ply]
+        history = self.history
+        scored = []
+        for move in moves:
+            plain = move & Board.MOVE_MASK
+            captures = CAPTURE_COUNTS[move >> Board.CAPTURE_SHIFT]
+            if captures:
+                score = captures * CAPTURE_SCORE
+            elif plain == killers[0] or plain == killers[1]:
+                score = KILLER_SCORE
+            else:
+                score = min(history[plain], KILLER_SCORE - 1)
+            scored.append((score, move))
+        scored.sort(reverse=True)
+        return [move for _, move in scored]
+
+    def _update_ordering(self, move, ply, depth):
+        # captures are already ordered first, only quiet moves become killers
+        if move >> Board.CAPTURE_SHIFT:
+            return
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[move] += depth * depth
+
+    def find_best_move_mtdf(self, board, time_limit=None):
+        """Best (score, move) by MTD(f): every depth of the deepening converges on the score with null window
+        searches only, starting from the score of the previous depth.
+
+        Needs the transposition table, the bounds of earlier passes keep re-searches cheap. mtdf_passes lists
+        (depth, nodes per pass) for every completed depth."""
+        self.transposition_table.new_search()
+        root = board
+        board = board.copy()
+        if self.pattern_weights is not None:
+            board.enable_patterns(self.pattern_weights)
+        self._reset_ordering()
+        time_limit = time_limit if time_limit is not None else self.time_limit
+
+        t0 = time.time()
+        print("Start MTD(f)")
+        self.deadline = None
+        self.completed_depth = 0
+        self.mtdf_passes = []
+        self.iteration_nodes = []
+        result = None
+        guess = 0
+        for i in range(2, self.max_depth+1, 2):
+            self.root_depth = i
+            passes = []
+            try:
+                score, move = self._mtdf(board, i, guess, passes)
+            except SearchTimeout:
+                print("Timeout at depth", i, "after", len(passes), "passes")
+                break
+            result = score, move
+            guess = score
+            self.completed_depth = i
+            self.mtdf_passes.append((i, passes))
+            self.iteration_nodes.append((i, sum(passes)))
+            print(i, score, self._unpack(root, move), len(passes), passes, time.time()-t0)
+            if time_limit is not None:
+                self.deadline = t0 + time_limit
+
+        self.deadline = None
+        score, move = result
+        return score, self._unpack(root, move)
+
+    def _mtdf(self, board, depth, guess, passes):
+        lower, upper = -10000000, 10000000
+        score, move = guess, None
+        while lower < upper:
+            beta = score + 1 if score == lower else score
+            self.moves_looked_at = 0
+            score, pass_move = self._negascout(board, depth, beta - 1, beta)
+            passes.append(self.moves_looked_at)
+            if score < beta:
+                upper = score
+            else:
+                lower = score
+            if pass_move is not None and (move is None or score >= beta):
+                move = pass_move
+        return score, move
+
+    @staticmethod
+    def _unpack(board, move):
+        # the search works on packed moves internally
+        return board.unpack_move(move) if move is not None else None
 
 
     @staticmethod
     def _current_player_score(board):
-        return board.get_num_occupied_fields(board.current_player)-board.get_num_occupied_fields(board.other_player)
+        # material is PLAYER1 - PLAYER2 and the player constants are 1 and -1
+        return board.material * board.current_player
+
+    def _evaluate(self, board):
+        if self.pattern_weights is not None:
+            return board.pattern_score * board.current_player
+        return NegaScout._current_player_score(board)
 
     @staticmethod
     def _current_player_score_moves(board):
-        return NegaScout._current_player_score(board) + len(board._get_moves_for(board.current_player)) - len(board._get_moves_for(board.other_player))
+        return NegaScout._current_player_score(board) + board.count_moves(board.current_player) - board.count_moves(board.other_player)
+
+    def _table_key(self, board):
+        # with use_symmetry all symmetric positions share one entry, moves are stored in the canonical orientation
+        if self.use_symmetry:
+            return board.canonical_key()
+        return board.key, None
+
+    @staticmethod
+    def _to_table_move(board, move, symmetry):
+        if symmetry is None or move is None:
+            return move
+        return board.pack_move(board.transform_move(board.unpack_move(move), symmetry))
+
+    @staticmethod
+    def _from_table_move(board, move, symmetry):
+        if symmetry is None or move is None:
+            return move
+        return board.pack_move(board.transform_move(board.unpack_move(move), board.INVERSE_SYMMETRY[symmetry]))
 
     def _negascout(self, board, depth, alpha, beta):
         self.moves_looked_at += 1
+        if self.moves_looked_at % self.check_every == 0:
+            if (self.deadline is not None and time.time() > self.deadline) or (self.stop_flag is not None and self.stop_flag[0]):
+                raise SearchTimeout()
+        alpha_orig = alpha
         if depth == 0:
-            return NegaScout._current_player_score(board), None
-
-        if self.use_move_ordering:
-            moves = [x[1] for x in sorted(board.get_moves_weighted_by_enemies(), key=lambda x: -x[0])]
+            if self.use_quiescence:
+                return self._quiescence(board, alpha, beta, self.quiescence_depth), None
+            return self._evaluate(board), None
+
+        if self.use_move_ordering or self.use_reductions:
+            moves = board.get_moves_packed(with_captures=True)
+            if not self.use_move_ordering:
+                random.shuffle(moves)
         else:
-            moves = board.get_moves()
+            moves = board.get_moves_packed()
             random.shuffle(moves)
 
         #only one move so we exit early
         if len(moves) == 1:
-            return 0, moves[0]
+            return 0, moves[0] & Board.MOVE_MASK
 
         if not moves:
             if board._is_draw():
@@ -80,94 +365,99 @@ class NegaScout():
             else:
                 return -9999999, None
         
-        best_move = None
-        used_move = None
-        if self.use_table and board.hash() in self.transposition_table:
-            record_type, h_board, h_depth, h_alpha, h_beta, h_best_move = self.transposition_table[board.hash()]
-            if not h_board == board.board:
-                print("collision", board.hash())
-                print(board.board)
-                print(h_board)
-                print("*********")
-
-            if record_type == 'exact' and h_best_move and depth <= h_depth:
-                #print(depth, 'exact', alpha, h_best_move)
+        best_score, best_move = -10000000, None
+        table_move = None
+        key, symmetry = self._table_key(board)
+        entry = self.transposition_table.probe(key) if self.use_table else None
+        if entry:
+            h_depth, h_bound, h_score, h_best_move = entry
+            h_best_move = self._from_table_move(board, h_best_move, symmetry)
+
+            if h_bound == EXACT and h_best_move is not None and depth <= h_depth:
                 self.exact_hits += 1
-                return h_alpha, h_best_move
-            if record_type == 'beta' and h_beta > beta and depth <= h_depth:
-                #print(depth, 'beta', h_best_move)
+                return h_score, h_best_move
+            if h_bound == LOWER and h_score >= beta and depth <= h_depth:
                 self.beta_hits += 1
-                return h_beta, h_best_move
+                return h_score, h_best_move
+            if h_bound == UPPER and h_score <= alpha and depth <= h_depth:
+                return h_score, h_best_move
 
-            if record_type == 'exact' and h_best_move and self.use_principal_variation:
-                #print(depth, 'pv_search', h_best_move)
-                used_move = h_best_move
-                self.pv_searches += 1
-                score, _ = self._negascout(board.move(h_best_move), depth-1, -beta, -alpha)
-                score *= -1
-                board.undo()
+            if self.use_table_move or (h_bound == EXACT and self.use_principal_variation):
+                table_move = h_best_move
 
-                if score >= beta:
-                    self.pv_searches_beta += 1
-                    return beta, h_best_move
-
-                if score > alpha:
-                    alpha, best_move = score, h_best_move
-                #print("inside", depth, alpha, beta, score, record_type, h_depth, h_alpha, h_beta, h_best_move)
-
-        for move in moves:
-            if used_move == move:
-                continue
+        ply = self.root_depth - depth
+        if self.use_move_ordering:
+            moves = self._order_moves(moves, ply)
+
+        # moves may carry capture bits, compare them without
+        if table_move is not None:
+            for i, move in enumerate(moves):
+                if move & Board.MOVE_MASK == table_move:
+                    moves.insert(0, moves.pop(i))
+                    self.pv_searches += 1
+                    break
+            else:
+                table_move = None
 
+        reduce_from = self.reduction_after if self.use_reductions and depth >= self.reduction_min_depth else len(moves)
+        killers = self.killers[ply] if self.use_move_ordering else ()
+        for i, move in enumerate(moves):
             #print_board(board)
             #board._pretty_print(board.player1)
             #board._pretty_print(board.player2)
             #print(depth, move, alpha, beta)
-            if self.use_principal_variation and used_move:
-                score, _ = self._negascout(board.move(move), depth-1, -alpha-1, -alpha)
-                if alpha < score < beta:
-                    score, _ = self._negascout(board, depth-1, -beta, -score)
-            else:
-                score, _ = self._negascout(board.move(move), depth-1, -beta, -alpha)
+            board.apply_packed(move)
+
+            # late quiet moves are probably bad, a reduced null window search has to show otherwise
+            reduce = i >= reduce_from and not move >> Board.CAPTURE_SHIFT and move not in killers
+            if reduce:
+                self.reductions += 1
+                score = -self._negascout(board, max(depth-1-self.reduction, 0), -alpha-1, -alpha)[0]
+                if score > alpha:
+                    self.reduction_researches += 1
+                    reduce = False
+
+            if not reduce:
+                if self.use_principal_variation and i > 0:
+                    # the first move is expected to be best, the others only have to be proven worse
+                    score = -self._negascout(board, depth-1, -alpha-1, -alpha)[0]
+                    if alpha < score < beta:
+                        self.researches += 1
+                        score = -self._negascout(board, depth-1, -beta, -score)[0]
+                else:
+                    score = -self._negascout(board, depth-1, -beta, -alpha)[0]
 
-            score *= -1
             board.undo()
             #print(depth, move, alpha, beta, score)
 
             if score >= beta:
-                self.transposition_table[board.hash()] = (
-                    'beta',
-                    board.board,
-                    depth,
-                    alpha,
-                    beta,
-                    best_move
-                )
-                return beta, move
-            
-            if score > alpha:
-                alpha, best_move = score, move
+                self.cutoffs += 1
+                if i == 0:
+                    self.first_move_cutoffs += 1
+                    if table_move is not None:
+                        self.pv_searches_beta += 1
+                if self.use_move_ordering:
+                    self._update_ordering(move, ply, depth)
+                move &= Board.MOVE_MASK
+                if self.use_table:
+                    self.transposition_table.store(key, depth, LOWER, score, self._to_table_move(board, move, symmetry))
+                return score, move
+
+            # fail soft, the best score is returned even if it is outside the window
+            if score > best_score:
+                best_score, best_move = score, move & Board.MOVE_MASK
+                alpha = max(alpha, score)
 
         if alpha == 1000000:
             print_board(board)
             print('depth', 'exact_save', alpha, beta, best_move)
             asd
 
-        hash_entry = (
-            'exact',
-            board.board,
-            depth,
-            alpha,
-            beta,
-            best_move
-        )
-
-        self.transposition_table[board.hash()] = hash_entry
-        #self.transposition_table[board.rotate_left().hash()] = hash_entry
-        #self.transposition_table[board.rotate_left().rotate_left().hash()] = hash_entry
-        #self.transposition_table[board.rotate_left().rotate_left().rotate_left().hash()] = hash_entry
-
-        return alpha, best_move
+        if self.use_table:
+            bound = EXACT if best_score > alpha_orig else UPPER
+            self.transposition_table.store(key, depth, bound, best_score, self._to_table_move(board, best_move, symmetry))
+
+        return best_score, best_move
 
 def self_play():
     board = BitBoard.standard_board()
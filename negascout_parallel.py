@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+import random
+import sys
+import time
+from multiprocessing import shared_memory
+
+from ArrayBoard import Board, History
+from negascout import NegaScout
+from transposition import TranspositionTable
+
+# the shared block starts with a small header, its first byte is the stop flag, the transposition table follows
+HEADER_SIZE = 64
+
+_worker = {}
+
+
+def _init_worker(name, options):
+    # worker searches print their iterations, keep the console of the main process readable
+    sys.stdout = open(os.devnull, 'w')
+    shared = shared_memory.SharedMemory(name=name)
+    table = TranspositionTable(buffer=shared.buf[HEADER_SIZE:])
+    search = NegaScout(transposition_table=table, **options)
+    search.stop_flag = shared.buf[:1]
+    _worker['shared'] = shared
+    _worker['search'] = search
+
+
+def _search(args):
+    worker_id, board, generation, time_limit = args
+    search = _worker['search']
+    # find_best_move starts the next generation, keep it in step with the main process
+    search.transposition_table.generation = (generation - 1) & 0xff
+
+    # helpers differ from the first worker by a perturbed history table and every other one by searching the odd
+    # depths, so they spread out over the tree and fill the shared table with entries the others can use
+    random.seed(worker_id * 7919 + generation)
+    start_depth = 2
+    if worker_id:
+        search.history = [random.randrange(64) for _ in range(len(search.history) or 1 << Board.CAPTURE_SHIFT)]
+        start_depth += worker_id % 2
+
+    t0 = time.time()
+    score, move = search.find_best_move(board, time_limit, start_depth)
+    return worker_id, search.completed_depth, score, move, time.time() - t0
+
+
+class ParallelNegaScout():
+    """Lazy SMP: worker processes search the same root independently and only share the transposition table.
+
+    The table lives in a multiprocessing.shared_memory block and is accessed without locks, torn entries are
+    rejected by the xor-ed key. As soon as one worker completes max_depth the others are stopped and the deepest
+    completed result is returned, the first worker winning ties. Search options are passed on to NegaScout."""
+
+    def __init__(self, max_depth=8, num_workers=None, table_size_mb=16, **options):
+        self.max_depth = max_depth
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.shared = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + TranspositionTable.buffer_size(table_size_mb))
+        self.stop_flag = self.shared.buf[:1]
+        self.transposition_table = TranspositionTable(buffer=self.shared.buf[HEADER_SIZE:])
+        self.transposition_table.clear()
+
+        options = dict(options, max_depth=max_depth)
+        self.pool = multiprocessing.Pool(self.num_workers, _init_worker, (self.shared.name, options))
+        self.results = []
+
+        print("""
+        Initializing Parallel Negascout:
+        Workers: {num_workers}
+        Table Size: {table_size_mb} MB
+        """.format(num_workers=self.num_workers, table_size_mb=table_size_mb))
+
+    def new_game(self):
+        self.transposition_table.clear()
+
+    def find_best_move(self, board, time_limit=None):
+        self.transposition_table.new_search()
+        self.stop_flag[0] = 0
+        generation = self.transposition_table.generation
+
+        # workers never undo past the root, send it without the moves before, only its repetition counts
+        root = board.copy()
+        root.history = History()
+
+        self.results = []
+        tasks = [(i, root, generation, time_limit) for i in range(self.num_workers)]
+        for result in self.pool.imap_unordered(_search, tasks):
+            self.results.append(result)
+            if result[1] >= self.max_depth:
+                self.stop_flag[0] = 1
+
+        worker_id, depth, score, move, seconds = max(self.results, key=lambda r: (r[1], -r[0]))
+        print("Worker", worker_id, "depth", depth, score, move, seconds)
+        return score, move
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        # the table views have to go before the shared block can be closed
+        self.stop_flag.release()
+        self.transposition_table.keys.release()
+        self.transposition_table.data.release()
+        self.transposition_table = None
+        self.shared.close()
+        self.shared.unlink()
@@ -0,0 +1,149 @@
+import array
+import sys
+
+from ArrayBoard import Board
+
+WINDOW_CELLS = 9
+NUM_PATTERNS = 3 ** WINDOW_CELLS
+
+# base-3 value of a window read as 9 bits, set bit k becomes digit 1 at position k
+BASE3 = [sum(3 ** k for k in range(WINDOW_CELLS) if m >> k & 1) for m in range(1 << WINDOW_CELLS)]
+
+# window cells are numbered like the bits, 8 is the top left and 0 the bottom right cell, 4 is the centre
+CENTER = 4
+# orthogonal neighbours of the centre and the window cells next to each of them
+ORTHOGONAL = [(7, (8, 6)), (5, (8, 2)), (3, (6, 0)), (1, (2, 0))]
+
+MATERIAL_WEIGHT = 4
+EXPOSED_WEIGHT = 1
+
+
+class PatternWindows():
+    """The 3x3 windows of one board shape, one centred on every square, cells off the board read as empty.
+
+    Windows are cut out of BitBoard masks shifted left by one bit (so no shift is negative) row by row: a
+    (shift, mask) pair per window row gives the three bits of that row, the left cell in the highest bit. For
+    incremental updates square_cells lists (window, 3 ** cell) for every window a square is part of."""
+    _cache = {}
+
+    @classmethod
+    def get(cls, size_x, size_y):
+        shape = (size_x, size_y)
+        windows = cls._cache.get(shape)
+        if windows is None:
+            windows = cls._cache[shape] = cls(size_x, size_y)
+        return windows
+
+    def __init__(self, size_x, size_y):
+        num_squares = size_x * size_y
+        on_board = lambda x, y: 0 <= x < size_x and 0 <= y < size_y
+        bit = lambda x, y: num_squares - 1 - (y * size_x + x)
+
+        self.rows = []
+        square_cells = [[] for _ in range(num_squares)]
+        for y in range(size_y):
+            for x in range(size_x):
+                rows = []
+                for row_y in [y - 1, y, y + 1]:
+                    if 0 <= row_y < size_y:
+                        mask = sum(1 << (2 - c) for c, col_x in enumerate([x - 1, x, x + 1]) if on_board(col_x, row_y))
+                        rows.extend([bit(x + 1, row_y) + 1, mask])
+                    else:
+                        rows.extend([0, 0])
+                for cell, (cell_x, cell_y) in enumerate((x + dx, y + dy) for dy in [1, 0, -1] for dx in [1, 0, -1]):
+                    if on_board(cell_x, cell_y):
+                        square_cells[bit(cell_x, cell_y)].append((len(self.rows), 3 ** cell))
+                self.rows.append(tuple(rows))
+        self.square_cells = [tuple(cells) for cells in square_cells]
+
+    def index(self, window, player1, player2):
+        """Base-3 pattern index of a window, player1/player2 are the board masks shifted left by one."""
+        s0, m0, s1, m1, s2, m2 = self.rows[window]
+        a = (player1 >> s0 & m0) << 6 | (player1 >> s1 & m1) << 3 | player1 >> s2 & m2
+        b = (player2 >> s0 & m0) << 6 | (player2 >> s1 & m1) << 3 | player2 >> s2 & m2
+        return BASE3[a] + 2 * BASE3[b]
+
+
+class PatternWeights():
+    """Evaluation by pattern lookup: one weight per base-3 3x3 pattern, summed over all windows of the board.
+
+    Scores are from the point of view of PLAYER1. BitBoard.enable_patterns() keeps the score and the pattern index
+    of every window up to date in move/undo, a move only adds the digit changes of the squares it changed to the
+    indices of the windows around them."""
+
+    def __init__(self, weights):
+        if len(weights) != NUM_PATTERNS:
+            raise ValueError("expected {} weights, got {}".format(NUM_PATTERNS, len(weights)))
+        self.weights = weights
+
+    def indices(self, board):
+        windows = PatternWindows.get(board.size_x, board.size_y)
+        player1, player2 = board.player1 << 1, board.player2 << 1
+        return [windows.index(w, player1, player2) for w in range(len(windows.rows))]
+
+    def evaluate(self, board):
+        weights = self.weights
+        return sum(weights[i] for i in self.indices(board))
+
+    def update(self, score, indices, windows, from_idx, to_idx, captured, digit):
+        """(score, indices) after a move of the player with the given digit (1 or 2), indices is not modified."""
+        weights = self.weights
+        square_cells = windows.square_cells
+        indices = indices[:]
+
+        # captured pieces change from the other digit to this one
+        changes = [(from_idx, -digit), (to_idx, digit)]
+        while captured:
+            low = captured & -captured
+            changes.append((low.bit_length() - 1, 2 * digit - 3))
+            captured ^= low
+
+        for square, delta in changes:
+            for w, power in square_cells[square]:
+                i = indices[w]
+                score -= weights[i]
+                i += delta * power
+                indices[w] = i
+                score += weights[i]
+        return score, indices
+
+
+def _cell_values(index):
+    # Board.PLAYER1/PLAYER2/EMPTY per window cell
+    values = []
+    for _ in range(WINDOW_CELLS):
+        index, digit = divmod(index, 3)
+        values.append([Board.EMPTY, Board.PLAYER1, Board.PLAYER2][digit])
+    return values
+
+
+def default_weights():
+    """Hand made weights: material of the centre piece, minus a penalty for every empty orthogonal neighbour an
+    enemy piece in the window could move to, which would capture the centre piece."""
+    weights = array.array('h', [0]) * NUM_PATTERNS
+    for index in range(NUM_PATTERNS):
+        cells = _cell_values(index)
+        owner = cells[CENTER]
+        if not owner:
+            continue
+        exposed = sum(1 for n, nearby in ORTHOGONAL if not cells[n] and any(cells[c] == -owner for c in nearby))
+        weights[index] = owner * (MATERIAL_WEIGHT - EXPOSED_WEIGHT * exposed)
+    return PatternWeights(weights)
+
+
+def save_weights(weights, path):
+    """Writes the weights as little endian 16 bit integers, NUM_PATTERNS * 2 bytes."""
+    data = array.array('h', weights.weights)
+    if sys.byteorder == 'big':
+        data.byteswap()
+    with open(path, 'wb') as f:
+        data.tofile(f)
+
+
+def load_weights(path):
+    data = array.array('h')
+    with open(path, 'rb') as f:
+        data.fromfile(f, NUM_PATTERNS)
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return PatternWeights(data)
@@ -0,0 +1,259 @@
+PROVEN, DISPROVEN, UNKNOWN = 'proven', 'disproven', 'unknown'
+
+INFINITY = 10 ** 9
+NO_DEPENDENCY = frozenset()
+# results relying on repetitions kept per position
+MAX_DEPENDENT = 4
+
+
+class SolverLimit(Exception):
+    pass
+
+
+class ProofNumberSearch():
+    """Depth-first proof-number (df-pn) solver for BitBoard positions.
+
+    solve() tries to prove that the side to move wins. The side to move loses when it has no moves, draws count as
+    not winning, so a disproof means the opponent wins or holds a draw. A position that repeats on the search path
+    is a draw: whoever could force it back once can force it a third time, which is when _is_draw() ends the game.
+
+    Nodes are kept in negamax form, (pn, dn) for the side to move winning, in a transposition table of at most
+    max_entries positions; when it is full the half with the smallest subtrees is dropped. Results that rely on a
+    repetition draw remember the repeated positions. They are first reused on any path, passing the repeated
+    positions on, and a disproof of the root found that way only counts once _certify() shows they all hold. If it
+    does not, the search is repeated reusing them only while all their repeated positions are on the search path."""
+
+    def __init__(self, max_nodes=1000000, max_entries=1 << 20):
+        self.max_nodes = max_nodes
+        self.max_entries = max_entries
+        self.table = {}
+        self.dependent = {}
+        self.not_won = set()
+        self.uncertified = 0
+        self.trusting = True
+        self.path_index = {}
+        self.nodes = 0
+        self.root_player = None
+
+    def solve(self, board):
+        """(PROVEN/DISPROVEN/UNKNOWN, line) for the side to move. For a proven win line is the winning line as a list
+        of moves up to the position the loser is stuck in, the loser's moves chosen to resist, otherwise it is []."""
+        board = board.copy()
+        self.table = {}
+        self.dependent = {}
+        self.not_won = set()
+        self.uncertified = 0
+        self.trusting = True
+        self.path_index = {}
+        self.nodes = 0
+        self.root_player = board.current_player
+
+        if board._is_draw() or not board.has_moves(board.current_player):
+            return DISPROVEN, []
+
+        while True:
+            try:
+                pn, dn, _ = self._mid(board, INFINITY, INFINITY, 0)
+            except SolverLimit:
+                return UNKNOWN, []
+            if not pn:
+                return PROVEN, self._line(board)
+
+            self._certify()
+            if board.key in self.not_won:
+                return DISPROVEN, []
+            # some of the results taken on trust do not hold, search again only reusing them on the right paths, the
+            # disproof found then does not depend on any position off the path
+            self.trusting = False
+
+    def _draw(self, board):
+        # a draw is a loss for the root player and a win for the opponent
+        return (INFINITY, 0) if board.current_player == self.root_player else (0, INFINITY)
+
+    def _child_value(self, board, repetitions=True):
+        """(pn, dn, dependencies) of the position on the board, which is not searched itself."""
+        key = board.key
+        if repetitions and key in self.path_index:
+            return self._draw(board) + (frozenset([key]),)
+        if board._is_draw():
+            return self._draw(board) + (NO_DEPENDENCY,)
+
+        for entry in self.dependent.get(key, ()):
+            if self.trusting or all(k in self.path_index or k in self.not_won for k in entry[2]):
+                return entry[:3]
+        entry = self.table.get(key)
+        if entry is not None:
+            return entry[:3]
+
+        if not board.has_moves(board.current_player):
+            return INFINITY, 0, NO_DEPENDENCY
+        return 1, 1, NO_DEPENDENCY
+
+    def _mid(self, board, thpn, thdn, ply):
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise SolverLimit()
+        start = self.nodes
+
+        key = board.key
+        self.path_index[key] = ply
+        children = []
+        for move in board.get_moves_packed():
+            board.apply_packed(move)
+            children.append([move] + list(self._child_value(board)))
+            board.undo()
+
+        while True:
+            # the side to move wins if one child loses, loses if all children win
+            pn = min(c[2] for c in children)
+            dn = self._disproof_number(children)
+            if pn >= thpn or dn >= thdn:
+                break
+
+            best = second = None
+            for c in children:
+                if best is None or c[2] < best[2]:
+                    best, second = c, best
+                elif second is None or c[2] < second[2]:
+                    second = c
+            second_dn = second[2] if second is not None else INFINITY
+
+            # stay in the child until it is no longer the best, with some slack against switching back and forth
+            child_thpn = min(thdn - dn + best[1], INFINITY)
+            child_thdn = min(thpn, int(second_dn * 1.25) + 1)
+            board.apply_packed(best[0])
+            best[1:] = self._mid(board, child_thpn, child_thdn, ply + 1)
+            board.undo()
+
+        # only a solved value can rely on a repetition, on those positions above this one or, taken on trust, off
+        # the path, but not on ones known not to be won
+        dependencies = NO_DEPENDENCY
+        if pn == 0:
+            dependencies = next(c[3] for c in children if c[2] == 0)
+        elif dn == 0:
+            dependencies = frozenset().union(*[c[3] for c in children])
+        if dependencies:
+            dependencies = frozenset(k for k in dependencies
+                                     if k not in self.not_won and self.path_index.get(k, -1) < ply)
+        del self.path_index[key]
+
+        self._store(key, pn, dn, dependencies, self.nodes - start)
+        if not dependencies and (dn if board.current_player == self.root_player else pn) == 0:
+            self.not_won.add(key)
+        return pn, dn, dependencies
+
+    def _disproof_number(self, children):
+        # weak proof numbers: a sum counts positions reached on several paths more than once and overflows in
+        # this game full of transpositions, the largest child plus one for each other child open does not
+        pns = [c[1] for c in children if c[1]]
+        if not pns:
+            return 0
+        if INFINITY in pns:
+            return INFINITY
+        return min(max(pns) + len(pns) - 1, INFINITY - 1)
+
+    def _store(self, key, pn, dn, dependencies, work):
+        if len(self.table) + len(self.dependent) >= self.max_entries:
+            # keep the half of the entries that took the most work to compute
+            works = sorted([e[3] for e in self.table.values()] + [v[-1][3] for v in self.dependent.values()])
+            cutoff = works[len(works) // 2]
+            self.table = {k: e for k, e in self.table.items() if e[3] > cutoff}
+            self.dependent = {k: v for k, v in self.dependent.items() if v[-1][3] > cutoff}
+            self.not_won &= self.table.keys()
+
+        if dependencies:
+            # only valid on some paths, kept apart so the result for other paths does not replace it
+            entries = self.dependent.setdefault(key, [])
+            entries.append((pn, dn, dependencies, work))
+            del entries[:-MAX_DEPENDENT]
+            self.uncertified += 1
+            if self.uncertified > max(len(self.dependent), 64):
+                self._certify()
+        else:
+            self.table[key] = (pn, dn, dependencies, work)
+
+    def _certify(self):
+        """Turns results relying on repetitions into ones valid on every path where possible.
+
+        Such a result is a disproof of the root player winning that holds if all its repeated positions are not won
+        by the root player either. A set of them relying only on each other and on known results holds as a whole:
+        a win never repeats a position, so of the positions wrongly in the set, the one closest to its win would
+        rely on another of them even closer to it."""
+        self.uncertified = 0
+        certified = set(self.dependent)
+        holds = lambda entry: all(k in certified or k in self.not_won for k in entry[2])
+
+        # remove results none of whose entries can hold, and with them the entries relying on them
+        open_entries = {}
+        users = {}
+        removed = []
+        for key, entries in self.dependent.items():
+            open_entries[key] = 0
+            for i, entry in enumerate(entries):
+                if holds(entry):
+                    open_entries[key] += 1
+                    for k in entry[2]:
+                        users.setdefault(k, []).append((key, i))
+            if not open_entries[key]:
+                removed.append(key)
+        dropped = set()
+        while removed:
+            key = removed.pop()
+            certified.discard(key)
+            for user in users.get(key, ()):
+                if user not in dropped:
+                    dropped.add(user)
+                    open_entries[user[0]] -= 1
+                    if not open_entries[user[0]]:
+                        removed.append(user[0])
+
+        for key in certified:
+            entry = next(e for e in self.dependent.pop(key) if holds(e))
+            self.table[key] = entry[:2] + (NO_DEPENDENCY, entry[3])
+            self.not_won.add(key)
+
+    def _work(self, key):
+        entries = [self.table[key]] if key in self.table else []
+        entries.extend(self.dependent.get(key, ()))
+        return max(entry[3] for entry in entries) if entries else 0
+
+    def _children(self, board):
+        children = []
+        for move in board.get_moves_packed():
+            board.apply_packed(move)
+            children.append((move, board.key, self._child_value(board, repetitions=False)))
+            board.undo()
+        return children
+
+    def _line(self, board):
+        """The winning line is played by the rules of the game, a repeated position is only drawn the third time, so
+        the winner steers clear of positions already on it while the loser can only repeat them to resist."""
+        line = []
+        self.path_index = {}
+        while len(line) < 200:
+            self.path_index.setdefault(board.key, len(line))
+            if board._is_draw() or not board.has_moves(board.current_player):
+                break
+
+            children = self._children(board)
+            if board.current_player == self.root_player:
+                winning = [c for c in children if c[2][1] == 0]
+                if not winning:
+                    # entries dropped from the table, settle this position again
+                    try:
+                        self._mid(board, INFINITY, INFINITY, len(line))
+                    except SolverLimit:
+                        break
+                    self.path_index.setdefault(board.key, len(line))
+                    winning = [c for c in self._children(board) if c[2][1] == 0]
+                    if not winning:
+                        break
+                # the smallest proof is the shortest way to the win
+                move = min(winning, key=lambda c: (c[1] in self.path_index, self._work(c[1])))[0]
+            else:
+                # resist with the move that took the most work to refute
+                move = max(children, key=lambda c: (c[1] not in self.path_index, self._work(c[1])))[0]
+
+            line.append(board.unpack_move(move))
+            board.apply_packed(move)
+        return line
@@ -0,0 +1,119 @@
+from ArrayBoard import Board
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# bytes per entry: the key xor-ed with the data word (8) and the data word (8)
+ENTRY_SIZE = 16
+
+# data word: score (32 bits, two's complement), move (a packed move without captures plus one bit, all ones for no
+# move), depth (8), bound (4) and generation (8)
+MOVE_SHIFT = 32
+MOVE_BITS = Board.CAPTURE_SHIFT + 1
+DEPTH_SHIFT = MOVE_SHIFT + MOVE_BITS
+BOUND_SHIFT = DEPTH_SHIFT + 8
+GENERATION_SHIFT = BOUND_SHIFT + 4
+EMPTY_MOVE = (1 << MOVE_BITS) - 1
+GENERATION_MASK = 0xff << GENERATION_SHIFT
+
+
+class TranspositionTable():
+    """Fixed size transposition table for NegaScout.
+
+    Entries live in two typed arrays (memoryviews over one preallocated buffer) and are grouped in buckets of two:
+    the first slot keeps the deepest search of the positions hashing there, the second one always takes the newest
+    entry. Each entry is a data word plus the full 64 bit zobrist key xor-ed with it, a slot with key word 0 is empty.
+
+    The table is meant to be kept between searches: new_search() starts a new generation and entries left over from
+    an older one lose their claim on the depth-preferred slot, so stale deep entries age out.
+
+    The buffer can be passed in, e.g. the buf of a multiprocessing.shared_memory block, to share one table between
+    processes without locks: a half written entry from another process no longer matches its key and is treated as
+    a miss."""
+
+    def __init__(self, size_mb=16, buffer=None):
+        if buffer is None:
+            buffer = bytearray(TranspositionTable.buffer_size(size_mb))
+        self.num_buckets = max(1, len(buffer) // (2 * ENTRY_SIZE))
+        self.num_entries = 2 * self.num_buckets
+        self.buffer = buffer
+        self._map_buffer()
+        self.used = 0
+        self.generation = 0
+        self.hits = 0
+        self.previous_hits = 0
+
+    @staticmethod
+    def buffer_size(size_mb):
+        """Bytes needed for a table of size_mb, for allocating a shared buffer."""
+        return max(1, (size_mb * 1024 * 1024) // (2 * ENTRY_SIZE)) * 2 * ENTRY_SIZE
+
+    def _map_buffer(self):
+        n = self.num_entries
+        view = memoryview(self.buffer)
+        self.keys = view[0:8 * n].cast('Q')
+        self.data = view[8 * n:16 * n].cast('Q')
+
+    def __len__(self):
+        """Number of slots filled through this object, other processes sharing the buffer are not counted."""
+        return self.used
+
+    def clear(self):
+        self.keys.cast('B')[:] = bytes(8 * self.num_entries)
+        self.data.cast('B')[:] = bytes(8 * self.num_entries)
+        self.used = 0
+        self.generation = 0
+        self.hits = 0
+        self.previous_hits = 0
+
+    def new_search(self):
+        """Starts a new generation, entries stored so far are kept but count as stale for replacement."""
+        self.generation = (self.generation + 1) & 0xff
+        self.hits = 0
+        self.previous_hits = 0
+
+    def probe(self, key):
+        """(depth, bound, score, move) stored for key or None, move is None if the entry has no best move."""
+        slot = (key % self.num_buckets) << 1
+        data = self.data[slot]
+        if self.keys[slot] ^ data != key:
+            slot += 1
+            data = self.data[slot]
+            if self.keys[slot] ^ data != key:
+                return None
+
+        self.hits += 1
+        if data >> GENERATION_SHIFT != self.generation:
+            # found again in this search, so it is not stale anymore
+            self.previous_hits += 1
+            data = (data & ~GENERATION_MASK) | (self.generation << GENERATION_SHIFT)
+            self.data[slot] = data
+            self.keys[slot] = key ^ data
+
+        score = data & 0xffffffff
+        if score & 0x80000000:
+            score -= 1 << 32
+        move = (data >> MOVE_SHIFT) & EMPTY_MOVE
+        return (data >> DEPTH_SHIFT) & 0xff, (data >> BOUND_SHIFT) & 0xf, score, move if move != EMPTY_MOVE else None
+
+    def store(self, key, depth, bound, score, move):
+        keys, data = self.keys, self.data
+        slot = (key % self.num_buckets) << 1
+
+        first = data[slot]
+        first_key = keys[slot] ^ first
+        if (first_key == key or depth >= (first >> DEPTH_SHIFT) & 0xff or not keys[slot]
+                or first >> GENERATION_SHIFT != self.generation):
+            # the deeper entry takes the first slot, whatever it pushes out moves to the always replace slot
+            if keys[slot] and first_key != key:
+                self._write(slot + 1, first_key, first)
+        else:
+            slot += 1
+
+        self._write(slot, key, (score & 0xffffffff) | ((move if move is not None else EMPTY_MOVE) << MOVE_SHIFT)
+                    | (depth << DEPTH_SHIFT) | (bound << BOUND_SHIFT) | (self.generation << GENERATION_SHIFT))
+
+    def _write(self, slot, key, data):
+        if not self.keys[slot]:
+            self.used += 1
+        self.data[slot] = data
+        self.keys[slot] = key ^ data
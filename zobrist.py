@@ -0,0 +1,19 @@
+import random
+
+# xor-ed into the key whenever PLAYER2 is to move
+SIDE_KEY = random.Random(0).getrandbits(64)
+
+_keys = {}
+
+
+def zobrist_keys(num_squares):
+    """Returns (player1_keys, player2_keys), one random 64 bit key per square and player.
+
+    The keys are generated from a fixed seed so equal positions get equal keys across boards and processes."""
+    if num_squares not in _keys:
+        rng = random.Random(num_squares)
+        _keys[num_squares] = (
+            [rng.getrandbits(64) for _ in range(num_squares)],
+            [rng.getrandbits(64) for _ in range(num_squares)]
+        )
+    return _keys[num_squares]